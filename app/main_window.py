@@ -34,10 +34,11 @@ def main():
     # Sidebar
     sidebar_section()
 
-    # Initialize chat session
+    # Initialize chat session (sekali per browser session; history selanjutnya dijaga di session state)
     if "current_session" not in st.session_state:
         create_new_session()
-    init_chat_history(st.session_state.get("current_session"))
+    elif "chat_history" not in st.session_state:
+        init_chat_history(st.session_state.current_session)
 
     # Title
     st.title("Collega AI Chatbot 🤖")
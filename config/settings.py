@@ -9,6 +9,9 @@ load_dotenv()
 GROQ_API_KEY = os.getenv("GROQ_API_KEY")
 SECTORS_API_KEY = os.getenv("SECTORS_API_KEY")
 
+# Direktori cache lokal yang bertahan antar restart proses
+CACHE_DIR = os.getenv("COLLEGA_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "collega"))
+
 # Groq Client (untuk legacy functions jika diperlukan)
 client = Groq(api_key=GROQ_API_KEY)
 
@@ -0,0 +1 @@
+# conftest di root repo agar pytest menambahkan root ke sys.path (import services.*, config.*)
@@ -3,14 +3,44 @@ LangChain Agent Service untuk Collega AI
 Manual tool routing dengan dynamic ticker detection
 FIXED: Quarterly financials year parameter
 """
-from typing import List, Optional
+from typing import List, Optional, Union
+import logging
+import os
+import pickle
 import re
+import time
+import traceback
+from collections import namedtuple
+from dataclasses import dataclass
+from functools import lru_cache
 from datetime import datetime
 from difflib import SequenceMatcher
+import streamlit as st
 from langchain_core.messages import HumanMessage, AIMessage, SystemMessage
-from config.settings import get_llm
+from config.settings import get_llm, CACHE_DIR
 from services.groq_service import get_chat_response
 
+# Trace routing per pesan hanya aktif jika COLLEGA_DEBUG=1 (dipakai juga oleh ui.chat_interface)
+log = logging.getLogger("collega")
+if os.getenv("COLLEGA_DEBUG") == "1":
+    log.setLevel(logging.DEBUG)
+    if not log.handlers:
+        log.addHandler(logging.StreamHandler())
+else:
+    log.setLevel(logging.WARNING)
+
+# RapidFuzz (C++) dipakai untuk fuzzy matching jika tersedia
+try:
+    from rapidfuzz import fuzz, process
+except ImportError:
+    fuzz = process = None
+
+# Aho-Corasick untuk scan banyak keyword dalam satu pass, jika tersedia
+try:
+    import ahocorasick
+except ImportError:
+    ahocorasick = None
+
 # Import tools
 try:
     from services.sectors_tools import (
@@ -41,12 +71,227 @@ except Exception as e:
 
 
 _COMPANY_CACHE = None
+_COMPANY_CACHE_FILE = os.path.join(CACHE_DIR, "companies.pkl")
+_COMPANY_CACHE_TTL = 24 * 60 * 60  # detik
+# Index nama perusahaan (lowercase) dan ticker, dibangun sekali bersama cache
+_COMPANY_NAMES: List[str] = []
+_COMPANY_TICKERS: List[str] = []
+_TICKER_LOOKUP: dict = {}
+_EXACT_NAME_MAP: dict = {}
+# Kata pertama nama perusahaan -> index kandidat, mempersempit fuzzy search
+_TOKEN_INDEX: dict = {}
+# Token set tiap nama perusahaan, untuk menyaring kandidat sebelum SequenceMatcher
+_NAME_TOKENS: List[frozenset] = []
+
+# Kata rujukan yang menandakan query bergantung pada konteks percakapan
+_PRONOUN_RE = re.compile(
+    r'\b(ini|itu|tersebut|tadi|sebelumnya|saham\s+ini|perusahaan\s+tersebut|data\s+quarter)\b',
+    re.I
+)
+# Ticker konteks dilupakan setelah sekian turn berturut-turut tanpa rujukan ke saham
+_CONTEXT_TICKER_MAX_IDLE_TURNS = 3
+
+
+def _compile_keywords(keywords) -> re.Pattern:
+    """Compile keywords into one substring-matching alternation (longest first)"""
+    alternatives = sorted(keywords, key=len, reverse=True)
+    return re.compile("|".join(re.escape(keyword) for keyword in alternatives))
+
+
+def _build_automaton(keywords):
+    """Build an Aho-Corasick automaton over keywords, or None without pyahocorasick"""
+    if ahocorasick is None:
+        return None
+
+    automaton = ahocorasick.Automaton()
+    for keyword in keywords:
+        automaton.add_word(keyword, keyword)
+    automaton.make_automaton()
+    return automaton
+
+
+def _find_keyword(text: str, automaton, pattern: re.Pattern) -> Optional[str]:
+    """Return the first keyword found in text, using the automaton when available"""
+    if automaton is not None:
+        for _, keyword in automaton.iter(text):
+            return keyword
+        return None
+
+    match = pattern.search(text)
+    return match.group(0) if match else None
+
+
+_QUICK_MAP = {
+    "bca": "BBCA",
+    "bank bca": "BBCA",
+    "pt bank central asia": "BBCA",
+    "bri": "BBRI",
+    "bank bri": "BBRI",
+    "bank rakyat indonesia": "BBRI",
+    "mandiri": "BMRI",
+    "bank mandiri": "BMRI",
+    "telkom": "TLKM",
+    "telkomsel": "TLKM",
+    "astra": "ASII",
+    "goto": "GOTO",
+    "gojek": "GOTO",
+    "tokopedia": "GOTO",
+    "bukalapak": "BUKA",
+    "buka": "BUKA",
+    "unilever": "UNVR",
+    "indofood": "INDF",
+    "adaro": "ADRO",
+}
+_QUICK_MAP_RE = _compile_keywords(_QUICK_MAP)
+_QUICK_MAP_AC = _build_automaton(_QUICK_MAP)
+_TICKER_RE = re.compile(r'\b([A-Z]{4})\b')
+# Kata umum 4 huruf yang bukan ticker
+_COMMON_WORDS = frozenset({
+    "DARI", "YANG", "AKAN", "INFO", "DATA", "HARI", "SAYA", "BANK",
+    "JUGA", "ATAU", "KATA", "BISA", "MANA", "INI"
+})
+
+# Keyword intent routing, dikompilasi sekali saat import
+_TOP_RE = _compile_keywords(["top", "terbesar", "tertinggi", "ranking", "papan atas"])
+_MCAP_RE = _compile_keywords(["market cap", "kapitalisasi", "nilai pasar"])
+_ENTITY_RE = _compile_keywords(["perusahaan", "saham", "emiten"])
+_QUARTER_RE = _compile_keywords(["quarter", "kuartal", "q1", "q2", "q3", "q4", "quarterly", "triwulan"])
+_SEGMENT_RE = _compile_keywords(["segmen", "segment", "bisnis", "breakdown", "pembagian"])
+_NEWS_RE = _compile_keywords(["berita", "news", "kabar"])
+_INDEX_RE = _compile_keywords(["lq45", "lq 45", "idx30", "idx 30", "kompas100"])
+_REPORT_RE = _compile_keywords(["laporan", "report", "analisis"])
+_SUBSECTOR_MAP = {
+    "bank": "banks",
+    "banking": "banks",
+    "perbankan": "banks",
+    "telekomunikasi": "telecommunication",
+    "energi": "energy",
+    "tambang": "mining",
+}
+_SUBSECTOR_RE = _compile_keywords(_SUBSECTOR_MAP)
+_SUBSECTOR_AC = _build_automaton(_SUBSECTOR_MAP)
+
+_NUMBER_RE = re.compile(r'\b(\d+)\b')
+_QUARTER_NUMBER_RE = re.compile(r'(?:quarter|q|kuartal)\s*(\d)')
+_YEAR_RE = re.compile(r'20\d{2}')
+
+_FINANCIAL_TERMS = [
+    "saham", "stock", "emiten", "ticker", "ihsg", "idx", "bursa",
+    "per", "pbv", "roe", "roa", "market cap", "kapitalisasi",
+    "gainer", "loser", "volume", "transaksi",
+    "bbca", "bbri", "bmri", "tlkm", "asii", "unvr", "goto", "buka",
+    "adro", "indf", "icbp", "klbf", "eraa", "antm", "ptba",
+    "bank bca", "bank bri", "bank mandiri", "bank rakyat",
+    "lq45", "lq 45", "idx30", "kompas100",
+    "perbankan", "telekomunikasi", "tambang", "properti", "energi",
+    "berita saham", "info saham", "harga saham",
+    "finansial", "financial", "laporan", "quarter", "kuartal"
+]
+_FINANCIAL_TERMS_RE = _compile_keywords(_FINANCIAL_TERMS)
+_FINANCIAL_TERMS_AC = _build_automaton(_FINANCIAL_TERMS)
+
+
+# Input user beserta versi lower/upper-nya, dihitung sekali per turn
+_Norm = namedtuple("_Norm", "raw lower upper")
+
+
+def normalize_query(text: Union[str, _Norm]) -> _Norm:
+    """Lowercase/uppercase the input once; already-normalized input is returned as-is"""
+    if isinstance(text, _Norm):
+        return text
+    return _Norm(text, text.lower(), text.upper())
+
+
+@dataclass(frozen=True, slots=True)
+class QueryPlan:
+    """Routing result for one user input, shared by is_financial_query and run_agent"""
+    text: str
+    text_lower: str
+    ticker: Optional[str]
+    intent: str
+    params: dict
+
+
+def build_query_plan(user_input: Union[str, _Norm]) -> QueryPlan:
+    """Run ticker extraction and intent routing once for the given input"""
+    norm = normalize_query(user_input)
+    intent, params = detect_intent_and_route(norm)
+    return QueryPlan(
+        text=norm.raw,
+        text_lower=norm.lower,
+        ticker=extract_ticker(norm),
+        intent=intent,
+        params=params
+    )
+
+
+def _set_company_cache(companies: List[dict]) -> None:
+    """Store companies and precompute the normalized lookup lists"""
+    global _COMPANY_CACHE, _COMPANY_NAMES, _COMPANY_TICKERS, _TICKER_LOOKUP, \
+        _EXACT_NAME_MAP, _TOKEN_INDEX, _NAME_TOKENS
+
+    # Dibangun di variabel lokal dulu: session lain bisa membaca global ini bersamaan
+    names = [company.get("company_name", "").lower() for company in companies]
+    tickers = [company.get("symbol", "") for company in companies]
+    ticker_lookup = {ticker.lower(): ticker for ticker in reversed(tickers)}
+    exact_name_map = {
+        name: ticker
+        for name, ticker in zip(reversed(names), reversed(tickers))
+        if name
+    }
+
+    token_index = {}
+    name_tokens = []
+    for index, name in enumerate(names):
+        tokens = name.split()
+        name_tokens.append(frozenset(tokens))
+        if tokens:
+            token_index.setdefault(tokens[0], []).append(index)
+
+    _COMPANY_NAMES = names
+    _COMPANY_TICKERS = tickers
+    _TICKER_LOOKUP = ticker_lookup
+    _EXACT_NAME_MAP = exact_name_map
+    _TOKEN_INDEX = token_index
+    _NAME_TOKENS = name_tokens
+    # Terakhir: pembaca yang melihat cache non-None pasti melihat index yang sudah lengkap
+    _COMPANY_CACHE = companies
+
+    # Hasil ticker/intent yang di-memoize dengan daftar perusahaan lama (atau kosong) jadi basi
+    _extract_ticker.cache_clear()
+    _route_intent.cache_clear()
+
+
+def _load_company_cache_file() -> Optional[List[dict]]:
+    """Load the pickled company list from disk if it is still within the TTL"""
+    try:
+        with open(_COMPANY_CACHE_FILE, "rb") as f:
+            payload = pickle.load(f)
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        print(f"⚠️ Failed to read company cache file: {e}")
+        return None
+
+    if time.time() - payload.get("ts", 0) >= _COMPANY_CACHE_TTL:
+        return None
+    return payload.get("data")
+
+
+def _save_company_cache_file(companies: List[dict]) -> None:
+    """Pickle the company list to disk so the next process starts warm"""
+    try:
+        os.makedirs(os.path.dirname(_COMPANY_CACHE_FILE), exist_ok=True)
+        tmp_path = f"{_COMPANY_CACHE_FILE}.tmp"
+        with open(tmp_path, "wb") as f:
+            pickle.dump({"ts": time.time(), "data": companies}, f)
+        os.replace(tmp_path, _COMPANY_CACHE_FILE)
+    except Exception as e:
+        print(f"⚠️ Failed to write company cache file: {e}")
 
 
 def get_all_companies() -> List[dict]:
     """Get and cache all companies from Sectors API"""
-    global _COMPANY_CACHE
-
     if _COMPANY_CACHE is not None:
         return _COMPANY_CACHE
 
@@ -57,7 +302,8 @@ def get_all_companies() -> List[dict]:
         companies = sectors_api.get_companies(n_stock=200)
 
         if isinstance(companies, list) and companies:
-            _COMPANY_CACHE = companies
+            _set_company_cache(companies)
+            _save_company_cache_file(companies)
             print(f"✅ Cached {len(companies)} companies")
             return companies
 
@@ -67,15 +313,18 @@ def get_all_companies() -> List[dict]:
             'mining', 'property', 'infrastructure', 'finance'
         ]
 
-        for subsector in common_subsectors:
-            try:
-                companies = sectors_api.get_companies_by_subsector(subsector, n_stock=50)
-                if isinstance(companies, list):
-                    all_companies.extend(companies)
-            except:
-                continue
-
-        _COMPANY_CACHE = all_companies
+        # Request per subsector independen: kirim paralel dalam satu batch async, urutan hasil tetap
+        responses = sectors_api.fetch_many([
+            sectors_api.companies_by_subsector_request(subsector)
+            for subsector in common_subsectors
+        ])
+        for companies in responses:
+            if isinstance(companies, list):
+                all_companies.extend(companies)
+
+        _set_company_cache(all_companies)
+        if all_companies:
+            _save_company_cache_file(all_companies)
         print(f"✅ Cached {len(all_companies)} companies (fallback method)")
         return all_companies
 
@@ -84,110 +333,140 @@ def get_all_companies() -> List[dict]:
         return []
 
 
+def _best_fuzzy_match(query: str, query_tokens: List[str], candidates) -> tuple[Optional[int], float]:
+    """Best (index, score) among candidate company indices; score is 0 when nothing clears 0.7"""
+    best_index = None
+    best_score = 0.0
+
+    if process is not None:
+        match = process.extractOne(
+            query,
+            [_COMPANY_NAMES[index] for index in candidates],
+            scorer=fuzz.ratio,
+            score_cutoff=70
+        )
+        if match:
+            best_score = match[1] / 100
+            best_index = candidates[match[2]]
+    else:
+        # Tanpa rapidfuzz: hanya nama yang berbagi token dengan query yang dibandingkan
+        query_set = set(query_tokens)
+        min_shared = min(2, len(query_set))
+        survivors = [
+            index for index in candidates
+            if len(query_set & _NAME_TOKENS[index]) >= min_shared
+        ]
+        for index in survivors:
+            score = SequenceMatcher(None, query, _COMPANY_NAMES[index]).ratio()
+            if score > best_score and score > 0.7:
+                best_score = score
+                best_index = index
+
+    return best_index, best_score
+
+
 def find_ticker_by_name(company_name: str) -> Optional[str]:
     """Find ticker by fuzzy matching company name"""
     if not company_name:
         return None
 
-    companies = get_all_companies()
-
-    if not companies:
+    if not get_all_companies():
         return None
 
     company_name_lower = company_name.lower().strip()
-    best_match = None
-    best_score = 0.0
-
-    for company in companies:
-        name = company.get("company_name", "").lower()
-        ticker = company.get("symbol", "")
 
-        if ticker.lower() == company_name_lower:
-            return ticker
-
-        score = SequenceMatcher(None, company_name_lower, name).ratio()
-
-        if company_name_lower in name:
-            score = max(score, 0.85)
-
-        if score > best_score:
-            best_score = score
-            best_match = ticker
+    exact_ticker = _TICKER_LOOKUP.get(company_name_lower) or _EXACT_NAME_MAP.get(company_name_lower)
+    if exact_ticker:
+        return exact_ticker
+
+    query_tokens = company_name_lower.split()
+    all_indices = range(len(_COMPANY_NAMES))
+    token_hits = _TOKEN_INDEX.get(query_tokens[0]) if query_tokens else None
+
+    # Kandidat dengan kata pertama yang sama dicek dulu; kata umum seperti "bank"/"pt"
+    # bisa tidak memuat perusahaan yang dicari, jadi tanpa hasil ulangi ke semua nama
+    best_index, best_score = _best_fuzzy_match(company_name_lower, query_tokens, token_hits or all_indices)
+    if best_index is None and token_hits:
+        best_index, best_score = _best_fuzzy_match(company_name_lower, query_tokens, all_indices)
+
+    # Nama yang memuat query dianggap cukup mirip (skor minimal 0.85);
+    # dicek di semua nama, karena query bisa berupa potongan tengah nama
+    if best_score < 0.85:
+        for index in all_indices:
+            if company_name_lower in _COMPANY_NAMES[index]:
+                best_score = 0.85
+                best_index = index
+                break
 
     if best_score > 0.7:
-        print(f"🎯 Found ticker: {best_match} (confidence: {best_score:.2%})")
+        best_match = _COMPANY_TICKERS[best_index]
+        log.debug("🎯 Found ticker: %s (confidence: %.2f%%)", best_match, best_score * 100)
         return best_match
 
     return None
 
 
-def extract_ticker(text: str) -> Optional[str]:
-    """Extract stock ticker from text with smart detection"""
-
-    quick_map = {
-        "bca": "BBCA",
-        "bank bca": "BBCA",
-        "pt bank central asia": "BBCA",
-        "bri": "BBRI",
-        "bank bri": "BBRI",
-        "bank rakyat indonesia": "BBRI",
-        "mandiri": "BMRI",
-        "bank mandiri": "BMRI",
-        "telkom": "TLKM",
-        "telkomsel": "TLKM",
-        "astra": "ASII",
-        "goto": "GOTO",
-        "gojek": "GOTO",
-        "tokopedia": "GOTO",
-        "bukalapak": "BUKA",
-        "buka": "BUKA",
-        "unilever": "UNVR",
-        "indofood": "INDF",
-        "adaro": "ADRO",
-    }
+def extract_ticker(text: Union[str, _Norm]) -> Optional[str]:
+    """Extract stock ticker from text with smart detection (memoized per input)"""
+    return _extract_ticker(normalize_query(text))
 
-    text_lower = text.lower()
 
-    for key, ticker in quick_map.items():
-        if key in text_lower:
-            print(f"✅ Quick match found: {key} -> {ticker}")
-            return ticker
+@lru_cache(maxsize=1024)
+def _extract_ticker(norm: _Norm) -> Optional[str]:
+    text = norm.raw
+    text_lower = norm.lower
 
-    text_upper = text.upper()
-    match = re.search(r'\b([A-Z]{4})\b', text_upper)
+    key = _find_keyword(text_lower, _QUICK_MAP_AC, _QUICK_MAP_RE)
+    if key:
+        ticker = _QUICK_MAP[key]
+        log.debug("✅ Quick match found: %s -> %s", key, ticker)
+        return ticker
+
+    match = _TICKER_RE.search(norm.upper)
     if match:
         potential_ticker = match.group(1)
-        common_words = ["DARI", "YANG", "AKAN", "INFO", "DATA", "HARI", "SAYA", "BANK",
-                       "JUGA", "ATAU", "KATA", "BISA", "MANA", "INI"]
-        if potential_ticker not in common_words:
-            print(f"✅ Explicit ticker found: {potential_ticker}")
+        if potential_ticker not in _COMMON_WORDS:
+            log.debug("✅ Explicit ticker found: %s", potential_ticker)
             return potential_ticker
 
     words = text.split()
-    potential_names = []
+    # dict dipakai sebagai ordered set: duplikat dibuang, urutan pencarian tetap
+    potential_names = {}
 
     for word in words:
         if len(word) > 3 and word[0].isupper():
-            potential_names.append(word)
+            potential_names[word] = None
 
+    # Semua posisi dicoba: nama perusahaan sering ditulis huruf kecil di tengah kalimat
     for i in range(len(words)):
         for j in range(i+1, min(i+4, len(words)+1)):
-            phrase = " ".join(words[i:j])
+            phrase_words = words[i:j]
+            if all(word.upper() in _COMMON_WORDS for word in phrase_words):
+                continue
+            phrase = " ".join(phrase_words)
             if len(phrase) > 3:
-                potential_names.append(phrase)
+                potential_names[phrase] = None
 
-    print(f"🔍 Potential company names: {potential_names}")
+    log.debug("🔍 Potential company names: %s", list(potential_names))
 
     for name in potential_names:
         ticker = find_ticker_by_name(name)
         if ticker:
             return ticker
 
-    print(f"❌ No ticker found in text: {text}")
+    log.debug("❌ No ticker found in text: %s", text)
     return None
 
 
-def detect_intent_and_route(user_input: str, chat_history: List = None) -> tuple[str, dict]:
+def detect_intent_and_route(user_input: Union[str, _Norm]) -> tuple[str, dict]:
+    """Detect user intent and route to appropriate tool (memoized per input)"""
+    intent, params = _route_intent(normalize_query(user_input))
+    # Salin params agar hasil yang tersimpan di cache tidak ikut termodifikasi
+    return intent, dict(params)
+
+
+@lru_cache(maxsize=1024)
+def _route_intent(norm: _Norm) -> tuple[str, dict]:
     """
     Detect user intent and route to appropriate tool
     
@@ -198,11 +477,12 @@ def detect_intent_and_route(user_input: str, chat_history: List = None) -> tuple
     3.  Logika 'stock_info' disederhanakan menjadi "jaring pengaman" (fallback) 
         jika ticker terdeteksi tapi tidak ada intent lain yang cocok.
     """
-    text_lower = user_input.lower()
+    user_input = norm.raw
+    text_lower = norm.lower
 
     # Ekstraksi ticker tetap berjalan, tapi kita tidak akan langsung menurutinya
-    ticker = extract_ticker(user_input)
-    print(f"🔍 Ticker extraction: {ticker}")
+    ticker = extract_ticker(norm)
+    log.debug("🔍 Ticker extraction: %s", ticker)
 
     # ======================================================================
     # LANGKAH 1: Cek Intent General (Non-Ticker) Prioritas Tinggi
@@ -211,24 +491,19 @@ def detect_intent_and_route(user_input: str, chat_history: List = None) -> tuple
     # 1. Top Companies (Top Market Cap)
     # Ini harus dicek SEBELUM stock_info, untuk menangkap "top 5 perusahaan"
     # dan mengabaikan ticker 'AGRO.JK' yang salah terdeteksi.
-    top_words = ["top", "terbesar", "tertinggi", "ranking", "papan atas"]
-    mcap_words = ["market cap", "kapitalisasi", "nilai pasar"]
-    # Pemicu baru: "perusahaan", "saham", "emiten"
-    entity_words = ["perusahaan", "saham", "emiten"] 
-
-    is_top_request = any(word in text_lower for word in top_words)
-    is_mcap_context = any(word in text_lower for word in mcap_words)
-    is_entity_context = any(word in text_lower for word in entity_words)
+    is_top_request = bool(_TOP_RE.search(text_lower))
+    is_mcap_context = bool(_MCAP_RE.search(text_lower))
+    is_entity_context = bool(_ENTITY_RE.search(text_lower))
 
     # Jika ini permintaan "top" DAN (menyebut "market cap" ATAU "perusahaan/saham")
     if is_top_request and (is_mcap_context or is_entity_context):
         number = 5 # Default
-        match = re.search(r'\b(\d+)\b', user_input)
+        match = _NUMBER_RE.search(user_input)
         if match:
             # Ambil angka pertama yang ditemukan (misal "top 5", "top 10")
             number = min(int(match.group(1)), 50)
         
-        print("✅ Routing to top_market_cap (Prioritized)")
+        log.debug("✅ Routing to top_market_cap (Prioritized)")
         return ("top_market_cap", {"limit": number})
 
     # ======================================================================
@@ -237,43 +512,41 @@ def detect_intent_and_route(user_input: str, chat_history: List = None) -> tuple
     
     if ticker:
         # 2. Quarterly/Financial Data Request
-        if any(
-            word in text_lower for word in ["quarter", "kuartal", "q1", "q2", "q3", "q4", "quarterly", "triwulan"]
-        ):
+        if _QUARTER_RE.search(text_lower):
             quarter = None
             year = None
 
             # Extract quarter
-            quarter_match = re.search(r'(?:quarter|q|kuartal)\s*(\d)', text_lower)
+            quarter_match = _QUARTER_NUMBER_RE.search(text_lower)
             if quarter_match:
                 quarter = int(quarter_match.group(1))
 
             # Extract year
-            year_match = re.search(r'20\d{2}', user_input)
+            year_match = _YEAR_RE.search(user_input)
             if year_match:
                 year = int(year_match.group(0))
             else:
                 if quarter:
                     year = datetime.now().year
-                    print(f"ℹ️ No year specified, using current year: {year}")
+                    log.debug("ℹ️ No year specified, using current year: %s", year)
 
             if quarter or year:
-                print(f"📅 Quarterly request: Q{quarter} {year}")
+                log.debug("📅 Quarterly request: Q%s %s", quarter, year)
                 return ("quarterly_financials", {"ticker": ticker, "quarter": quarter, "year": year})
 
         # 3. Company Segments
-        if any(word in text_lower for word in ["segmen", "segment", "bisnis", "breakdown", "pembagian"]):
+        if _SEGMENT_RE.search(text_lower):
             return ("company_segments", {"ticker": ticker})
 
         # 4. News (jika ada ticker)
-        if any(word in text_lower for word in ["berita", "news", "kabar"]):
+        if _NEWS_RE.search(text_lower):
             return ("market_news", {"query": ticker, "limit": 10})
 
         # 5. Stock Info (Sebagai Fallback/Jaring Pengaman)
         # Jika ada ticker, tapi BUKAN request kuartal, segmen, atau news,
         # maka kita asumsikan user ingin info umum saham tersebut.
         # Kita tidak perlu lagi cek 'not_ranking' karena 'top_market_cap' sudah dicek duluan.
-        print(f"✅ Routing to stock_info (Fallback for ticker): {ticker}")
+        log.debug("✅ Routing to stock_info (Fallback for ticker): %s", ticker)
         return ("stock_info", {"ticker": ticker})
 
     # ======================================================================
@@ -281,85 +554,84 @@ def detect_intent_and_route(user_input: str, chat_history: List = None) -> tuple
     # ======================================================================
 
     # 6. News (general)
-    if any(word in text_lower for word in ["berita", "news", "kabar"]):
+    if _NEWS_RE.search(text_lower):
         return ("market_news", {"query": None, "limit": 10})
 
     # 7. Index queries
-    index_keywords = ["lq45", "lq 45", "idx30", "idx 30", "kompas100"]
-    for keyword in index_keywords:
-        if keyword in text_lower:
-            index_name = keyword.replace(" ", "").upper()
-            return ("companies_by_index", {"index": index_name, "limit": 20})
+    index_match = _INDEX_RE.search(text_lower)
+    if index_match:
+        index_name = index_match.group(0).replace(" ", "").upper()
+        return ("companies_by_index", {"index": index_name, "limit": 20})
 
     # 8. Subsector queries
-    subsector_map = {
-        "bank": "banks",
-        "banking": "banks",
-        "perbankan": "banks",
-        "telekomunikasi": "telecommunication",
-        "energi": "energy",
-        "tambang": "mining",
-    }
-
-    for keyword, subsector in subsector_map.items():
-        if keyword in text_lower:
-            if any(word in text_lower for word in ["laporan", "report", "analisis"]):
-                return ("subsector_report", {"subsector": subsector})
-            return ("companies_subsector", {"subsector": subsector, "limit": 20})
+    subsector_keyword = _find_keyword(text_lower, _SUBSECTOR_AC, _SUBSECTOR_RE)
+    if subsector_keyword:
+        subsector = _SUBSECTOR_MAP[subsector_keyword]
+        if _REPORT_RE.search(text_lower):
+            return ("subsector_report", {"subsector": subsector})
+        return ("companies_subsector", {"subsector": subsector, "limit": 20})
 
     # Jika semua gagal
-    print(f"⚠️ No intent matched")
+    log.debug("⚠️ No intent matched")
     return ("unknown", {})
 
 
+# Warm start: pakai daftar perusahaan dari disk tanpa memanggil API
+# (setelah fungsi routing terdefinisi, karena _set_company_cache mengosongkan cache-nya)
+_disk_companies = _load_company_cache_file()
+if _disk_companies:
+    _set_company_cache(_disk_companies)
+    print(f"✅ Loaded {len(_disk_companies)} companies from disk cache")
+
+
 def execute_tool(intent: str, params: dict) -> Optional[str]:
     """Execute the appropriate tool based on intent"""
     try:
-        print(f"🔧 Executing tool: {intent} with params: {params}")
+        log.debug("🔧 Executing tool: %s with params: %s", intent, params)
 
         if intent == "stock_info":
             result = get_stock_info.invoke(params)
-            print(f"📊 Stock info result preview: {result[:200] if result else 'None'}...")
+            log.debug("📊 Stock info result preview: %s...", result[:200] if result else 'None')
             return result
 
         elif intent == "quarterly_financials":
             result = get_quarterly_financials.invoke(params)
-            print(f"📊 Quarterly financials result preview: {result[:200] if result else 'None'}...")
+            log.debug("📊 Quarterly financials result preview: %s...", result[:200] if result else 'None')
             return result
 
         elif intent == "company_segments":
             result = get_company_segments.invoke(params)
-            print(f"📊 Company segments result preview: {result[:200] if result else 'None'}...")
+            log.debug("📊 Company segments result preview: %s...", result[:200] if result else 'None')
             return result
 
         elif intent == "market_news":
             result = get_market_news.invoke(params)
-            print(f"📊 Market news result preview: {result[:200] if result else 'None'}...")
+            log.debug("📊 Market news result preview: %s...", result[:200] if result else 'None')
             return result
 
         elif intent == "top_market_cap":
             result = get_top_stocks_by_market_cap.invoke(params)
-            print(f"📊 Top market cap result preview: {result[:200] if result else 'None'}...")
+            log.debug("📊 Top market cap result preview: %s...", result[:200] if result else 'None')
             return result
 
         elif intent == "companies_by_index":
             result = get_companies_by_index.invoke(params)
-            print(f"📊 Companies by index result preview: {result[:200] if result else 'None'}...")
+            log.debug("📊 Companies by index result preview: %s...", result[:200] if result else 'None')
             return result
 
         elif intent == "companies_subsector":
             result = get_companies_by_subsector.invoke(params)
-            print(f"📊 Companies subsector result preview: {result[:200] if result else 'None'}...")
+            log.debug("📊 Companies subsector result preview: %s...", result[:200] if result else 'None')
             return result
 
         elif intent == "subsector_report":
             result = get_subsector_report.invoke(params)
-            print(f"📊 Subsector report result preview: {result[:200] if result else 'None'}...")
+            log.debug("📊 Subsector report result preview: %s...", result[:200] if result else 'None')
             return result
 
         elif intent == "idx_market_cap_history":
             result = get_idx_market_cap_history.invoke(params)
-            print(f"📊 IDX market cap history result preview: {result[:200] if result else 'None'}...")
+            log.debug("📊 IDX market cap history result preview: %s...", result[:200] if result else 'None')
             return result
 
         else:
@@ -372,20 +644,54 @@ def execute_tool(intent: str, params: dict) -> Optional[str]:
         return None
 
 
-def run_agent(user_input: str, chat_history: List = None, rag_context: str = "") -> Optional[str]:
-    """Run agent with manual tool routing + LLM context resolution"""
+def run_agent(
+    user_input: Union[str, _Norm],
+    chat_history: List = None,
+    rag_context: str = "",
+    plan: Optional[QueryPlan] = None,
+    history_summary: str = ""
+) -> Optional[str]:
+    """
+    Run agent with manual tool routing + LLM context resolution
+
+    Args:
+        plan: QueryPlan from is_financial_query; skips re-routing the same input
+        history_summary: Summary of older turns that are no longer in chat_history
+    """
     try:
-        resolved_query = resolve_query_with_context(user_input, chat_history)
+        norm = normalize_query(user_input)
+        user_input = norm.raw
 
-        intent, params = detect_intent_and_route(resolved_query, chat_history)
+        if plan is None or plan.text != user_input:
+            plan = build_query_plan(norm)
 
-        print(f"🔍 Intent detected: {intent}")
-        print(f"📋 Params: {params}")
+        # Jika ticker sudah terdeteksi di input asli, kata rujukan di-resolve
+        # langsung oleh LLM utama lewat system prompt (satu round-trip saja).
+        # Resolver terpisah hanya dipakai bila routing butuh konteks tambahan.
+        resolved_query = user_input
+        if not plan.params.get("ticker"):
+            resolved_query = resolve_query_with_context(user_input, chat_history)
+
+        intent, params = plan.intent, dict(plan.params)
+
+        # Routing ulang hanya jika resolver benar-benar mengubah query
+        if resolved_query != user_input:
+            intent, params = detect_intent_and_route(resolved_query)
+
+        log.debug("🔍 Intent detected: %s", intent)
+        log.debug("📋 Params: %s", params)
+
+        # Simpan ticker terakhir sebagai konteks untuk turn berikutnya
+        # (intent market_news membawa ticker di key "query")
+        last_ticker = params.get("ticker") or params.get("query")
+        if last_ticker:
+            st.session_state["last_ticker"] = last_ticker
+            st.session_state["last_ticker_idle"] = 0
 
         if intent != "unknown":
             tool_result = execute_tool(intent, params)
 
-            print(f"✅ Tool executed, result length: {len(str(tool_result)) if tool_result else 0}")
+            log.debug("✅ Tool executed, result length: %s", len(str(tool_result)) if tool_result else 0)
 
             if tool_result and not tool_result.startswith("❌"):
                 system_prompt = f"""You are Collega AI Assistant, a helpful financial chatbot specializing in Indonesian stock market.
@@ -404,6 +710,7 @@ INSTRUCTIONS:
 5. Format numbers with thousand separators (Rp)
 6. Highlight key metrics that answer the question
 7. Keep response concise but informative
+8. If the question refers to earlier messages (e.g. "saham ini", "tadi", "tersebut"), first resolve those references using the conversation history, then answer
 
 Now, provide a natural conversational response:"""
 
@@ -412,6 +719,13 @@ Now, provide a natural conversational response:"""
 
 ADDITIONAL CONTEXT FROM UPLOADED DOCUMENTS:
 {rag_context}
+"""
+
+                if history_summary:
+                    system_prompt += f"""
+
+SUMMARY OF THE EARLIER CONVERSATION:
+{history_summary}
 """
 
                 messages = [
@@ -430,63 +744,60 @@ ADDITIONAL CONTEXT FROM UPLOADED DOCUMENTS:
                 response = get_chat_response(messages)
                 return response
 
-        print(f"⚠️ No tool matched or tool failed, returning None for fallback")
+        log.debug("⚠️ No tool matched or tool failed, returning None for fallback")
         return None
 
     except Exception as e:
         print(f"❌ Agent error: {str(e)}")
-        import traceback
         traceback.print_exc()
         return None
 
 
-def is_financial_query(user_input: str, chat_history: List = None) -> bool:
-    """Detect if query is financial-related with CONTEXT AWARENESS"""
+def is_financial_query(user_input: Union[str, _Norm], chat_history: List = None) -> tuple[bool, Optional[QueryPlan]]:
+    """
+    Detect if query is financial-related with CONTEXT AWARENESS
+
+    Returns:
+        tuple: (is_financial, QueryPlan to pass on to run_agent)
+    """
     if not SECTORS_AVAILABLE:
         print("⚠️ SECTORS_AVAILABLE is False")
-        return False
-
-    text_lower = user_input.lower()
-
-    specific_financial_terms = [
-        "saham", "stock", "emiten", "ticker", "ihsg", "idx", "bursa",
-        "per", "pbv", "roe", "roa", "market cap", "kapitalisasi",
-        "gainer", "loser", "volume", "transaksi",
-        "bbca", "bbri", "bmri", "tlkm", "asii", "unvr", "goto", "buka",
-        "adro", "indf", "icbp", "klbf", "eraa", "antm", "ptba",
-        "bank bca", "bank bri", "bank mandiri", "bank rakyat",
-        "lq45", "lq 45", "idx30", "kompas100",
-        "perbankan", "telekomunikasi", "tambang", "properti", "energi",
-        "berita saham", "info saham", "harga saham",
-        "finansial", "financial", "laporan", "quarter", "kuartal"
-    ]
+        return False, None
 
-    has_financial_term = any(term in text_lower for term in specific_financial_terms)
+    # Ticker dan intent sudah di-memoize per query (_extract_ticker/_route_intent)
+    plan = build_query_plan(user_input)
+    ticker = plan.ticker
+    intent = plan.intent
 
-    ticker = extract_ticker(user_input)
+    has_financial_term = _find_keyword(plan.text_lower, _FINANCIAL_TERMS_AC, _FINANCIAL_TERMS_RE) is not None
 
+    # Ticker dari turn sebelumnya disimpan oleh run_agent, tanpa scan ulang history
     context_ticker = None
     if not ticker and chat_history:
-        for msg in reversed(chat_history[-5:]):
-            if isinstance(msg, (HumanMessage, AIMessage)):
-                potential_ticker = extract_ticker(msg.content)
-                if potential_ticker:
-                    context_ticker = potential_ticker
-                    print(f"🔍 Found context ticker: {context_ticker}")
-                    break
-
-    intent, _ = detect_intent_and_route(user_input, chat_history)
+        context_ticker = st.session_state.get("last_ticker")
+        if has_financial_term or intent != "unknown" or _PRONOUN_RE.search(plan.text):
+            st.session_state["last_ticker_idle"] = 0
+        elif context_ticker:
+            # Turn ini tidak merujuk saham: ticker konteks menua dan akhirnya dilupakan
+            idle = st.session_state.get("last_ticker_idle", 0) + 1
+            st.session_state["last_ticker_idle"] = idle
+            if idle > _CONTEXT_TICKER_MAX_IDLE_TURNS:
+                st.session_state.pop("last_ticker", None)
+                st.session_state.pop("last_ticker_idle", None)
+                context_ticker = None
+        if context_ticker:
+            log.debug("🔍 Found context ticker: %s", context_ticker)
 
     result = has_financial_term or ticker is not None or context_ticker is not None or intent != "unknown"
 
-    print(f"🔍 Financial query check:")
-    print(f"   - Has financial term: {has_financial_term}")
-    print(f"   - Ticker found: {ticker}")
-    print(f"   - Context ticker: {context_ticker}")
-    print(f"   - Intent: {intent}")
-    print(f"   - Result: {result}")
+    log.debug("🔍 Financial query check:")
+    log.debug("   - Has financial term: %s", has_financial_term)
+    log.debug("   - Ticker found: %s", ticker)
+    log.debug("   - Context ticker: %s", context_ticker)
+    log.debug("   - Intent: %s", intent)
+    log.debug("   - Result: %s", result)
 
-    return result
+    return result, plan
 
 
 def resolve_query_with_context(user_input: str, chat_history: List = None) -> str:
@@ -494,6 +805,10 @@ def resolve_query_with_context(user_input: str, chat_history: List = None) -> st
     if not chat_history or len(chat_history) < 2:
         return user_input
 
+    # Query tanpa kata rujukan sudah lengkap, tidak perlu round-trip ke LLM
+    if not _PRONOUN_RE.search(user_input):
+        return user_input
+
     recent_context = []
     for msg in chat_history[-5:]:
         if isinstance(msg, HumanMessage):
@@ -503,6 +818,23 @@ def resolve_query_with_context(user_input: str, chat_history: List = None) -> st
 
     context_str = "\n".join(recent_context)
 
+    try:
+        resolved_query = _resolve_with_llm(user_input, context_str)
+
+        log.debug("🔄 Query resolution:")
+        log.debug("   Original: %s", user_input)
+        log.debug("   Resolved: %s", resolved_query)
+
+        return resolved_query
+
+    except Exception as e:
+        print(f"⚠️ Context resolution failed: {e}")
+        return user_input
+
+
+@lru_cache(maxsize=256)
+def _resolve_with_llm(user_input: str, context_str: str) -> str:
+    """Ask the LLM to rewrite the query; cached per (query, context)"""
     resolution_prompt = f"""You are a context resolver. Given a conversation history and a new user query, your job is to rewrite the query to include all necessary context.
 
 CONVERSATION HISTORY:
@@ -520,21 +852,10 @@ Return ONLY the resolved query text, nothing else. No explanation, no markdown.
 
 RESOLVED QUERY:"""
 
-    try:
-        messages = [
-            {"role": "system",
-             "content": "You are a context resolver. Return only the resolved query, no explanation."},
-            {"role": "user", "content": resolution_prompt}
-        ]
-
-        resolved_query = get_chat_response(messages).strip()
-
-        print(f"🔄 Query resolution:")
-        print(f"   Original: {user_input}")
-        print(f"   Resolved: {resolved_query}")
-
-        return resolved_query
+    messages = [
+        {"role": "system",
+         "content": "You are a context resolver. Return only the resolved query, no explanation."},
+        {"role": "user", "content": resolution_prompt}
+    ]
 
-    except Exception as e:
-        print(f"⚠️ Context resolution failed: {e}")
-        return user_input
\ No newline at end of file
+    return get_chat_response(messages).strip()
\ No newline at end of file
@@ -0,0 +1,90 @@
+"""
+Cache TTL dua tingkat (memori + file JSON) untuk response API
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Optional
+
+
+class FileCache:
+    """Cache key-value dengan TTL: LRU di memori, lalu file JSON di disk"""
+
+    def __init__(self, directory: str, max_memory_items: int = 256):
+        """
+        Args:
+            directory: Folder tempat file cache disimpan
+            max_memory_items: Jumlah entry maksimum di memori
+        """
+        self.directory = directory
+        self.max_memory_items = max_memory_items
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _path(self, key: str) -> str:
+        digest = hashlib.blake2b(key.encode("utf-8"), digest_size=16).hexdigest()
+        return os.path.join(self.directory, f"{digest}.json")
+
+    @staticmethod
+    def _is_fresh(ts: float, ttl: Optional[float]) -> bool:
+        # ttl None berarti data tidak pernah kedaluwarsa
+        return ttl is None or time.time() - ts < ttl
+
+    def _remember(self, key: str, ts: float, data: Any) -> None:
+        with self._lock:
+            self._memory[key] = (ts, data)
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.max_memory_items:
+                self._memory.popitem(last=False)
+
+    def get(self, key: str, ttl: Optional[float]) -> Optional[Any]:
+        """
+        Ambil data yang masih dalam TTL
+
+        Args:
+            key: Cache key
+            ttl: Umur maksimum dalam detik (None = permanen)
+
+        Returns:
+            Data tersimpan, atau None jika tidak ada / sudah kedaluwarsa
+        """
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                self._memory.move_to_end(key)
+
+        if entry is not None and self._is_fresh(entry[0], ttl):
+            return entry[1]
+
+        try:
+            with open(self._path(key), "r", encoding="utf-8") as f:
+                payload = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+        except Exception as e:
+            print(f"⚠️ Failed to read cache file: {e}")
+            return None
+
+        if not self._is_fresh(payload.get("ts", 0), ttl):
+            return None
+
+        self._remember(key, payload["ts"], payload.get("data"))
+        return payload.get("data")
+
+    def put(self, key: str, data: Any) -> None:
+        """Simpan data ke memori dan ke disk (ditulis atomik)"""
+        ts = time.time()
+        self._remember(key, ts, data)
+
+        path = self._path(key)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({"ts": ts, "data": data}, f, ensure_ascii=False)
+            os.replace(tmp_path, path)
+        except Exception as e:
+            print(f"⚠️ Failed to write cache file: {e}")
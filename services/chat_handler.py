@@ -2,10 +2,39 @@ import streamlit as st
 from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder, SystemMessagePromptTemplate, \
     HumanMessagePromptTemplate
 from langchain_core.messages import HumanMessage, AIMessage, SystemMessage
-from services.groq_service import get_chat_response
-from services.rag_pipeline import retrieve_context
+from services.groq_service import stream_chat_response
+from services.rag_pipeline import retrieve_context, active_vectorstore
 from utils.memory import save_current_session
 
+# Role chat history -> class message LangChain (lookup sekali per pesan, bukan rantai if/elif)
+_MSG_CLASS = {"user": HumanMessage, "assistant": AIMessage, "system": SystemMessage}
+
+
+# Prompt template dengan RAG context
+_RAG_SYSTEM_TEMPLATE = """You are Collega AI Assistant, a friendly and helpful chatbot created to assist users.
+Use the following context from the uploaded document to help answer the question:
+
+Context:
+{context}
+
+Always base your answer on the provided context when relevant."""
+
+# Prompt template tanpa context
+_PLAIN_SYSTEM_TEMPLATE = """You are Collega AI Assistant, a friendly and helpful chatbot created to assist users.
+If the user uploaded a document, use that as additional context."""
+
+_RAG_TEMPLATE = ChatPromptTemplate.from_messages([
+    SystemMessagePromptTemplate.from_template(_RAG_SYSTEM_TEMPLATE),
+    MessagesPlaceholder(variable_name="chat_history"),
+    HumanMessagePromptTemplate.from_template("{input}")
+])
+
+_PLAIN_TEMPLATE = ChatPromptTemplate.from_messages([
+    SystemMessagePromptTemplate.from_template(_PLAIN_SYSTEM_TEMPLATE),
+    MessagesPlaceholder(variable_name="chat_history"),
+    HumanMessagePromptTemplate.from_template("{input}")
+])
+
 
 def display_chat_history():
     """
@@ -29,52 +58,22 @@ def build_messages_with_langchain(prompt: str) -> tuple[list, str]:
     context_text = ""
 
     # Jika ada vectorstore (RAG aktif)
-    if "vectorstore" in st.session_state and st.session_state["vectorstore"] is not None:
+    vectorstore = active_vectorstore()
+    if vectorstore is not None:
         with st.spinner("🔍 Mengambil konteks dari dokumen..."):
-            context_text, sources = retrieve_context(st.session_state["vectorstore"], prompt)
+            context_text, sources = retrieve_context(vectorstore, prompt)
             if context_text:
                 st.info(f"📚 Ditemukan konteks dari dokumen: {len(sources)} sumber")
 
-    # Definisikan system prompt dengan atau tanpa RAG context
+    # Format prompt dengan variable, memakai template yang sudah dibangun saat import
     if context_text:
-        system_template = """You are Collega AI Assistant, a friendly and helpful chatbot created to assist users.
-Use the following context from the uploaded document to help answer the question:
-
-Context:
-{context}
-
-Always base your answer on the provided context when relevant."""
-
-        system_prompt = SystemMessagePromptTemplate.from_template(system_template)
-
-        # Buat prompt template dengan context
-        prompt_template = ChatPromptTemplate.from_messages([
-            system_prompt,
-            MessagesPlaceholder(variable_name="chat_history"),
-            HumanMessagePromptTemplate.from_template("{input}")
-        ])
-
-        # Format prompt dengan variable
-        formatted_prompt = prompt_template.format_messages(
+        formatted_prompt = _RAG_TEMPLATE.format_messages(
             context=context_text,
             chat_history=convert_chat_history_to_langchain(),
             input=prompt
         )
     else:
-        system_template = """You are Collega AI Assistant, a friendly and helpful chatbot created to assist users.
-If the user uploaded a document, use that as additional context."""
-
-        system_prompt = SystemMessagePromptTemplate.from_template(system_template)
-
-        # Buat prompt template tanpa context
-        prompt_template = ChatPromptTemplate.from_messages([
-            system_prompt,
-            MessagesPlaceholder(variable_name="chat_history"),
-            HumanMessagePromptTemplate.from_template("{input}")
-        ])
-
-        # Format prompt dengan variable
-        formatted_prompt = prompt_template.format_messages(
+        formatted_prompt = _PLAIN_TEMPLATE.format_messages(
             chat_history=convert_chat_history_to_langchain(),
             input=prompt
         )
@@ -99,34 +98,30 @@ def convert_chat_history_to_langchain():
     Returns:
         list: List of LangChain message objects
     """
-    langchain_history = []
-
-    for message in st.session_state.chat_history:
-        if message["role"] == "user":
-            langchain_history.append(HumanMessage(content=message["content"]))
-        elif message["role"] == "assistant":
-            langchain_history.append(AIMessage(content=message["content"]))
-        elif message["role"] == "system":
-            langchain_history.append(SystemMessage(content=message["content"]))
-
-    return langchain_history
+    # Role yang tidak dikenal dilewati, sama seperti sebelumnya
+    return [
+        _MSG_CLASS[message["role"]](content=message["content"])
+        for message in st.session_state.chat_history
+        if message["role"] in _MSG_CLASS
+    ]
 
 
 def get_bot_response(messages: list) -> str:
     """
-    Mendapatkan response dari bot (Groq API)
+    Mendapatkan response dari bot (Groq API) secara streaming.
+    Harus dipanggil di dalam container ``st.chat_message("assistant")``.
 
     Args:
         messages: List pesan untuk dikirim ke API
 
     Returns:
-        str: Response dari bot
+        str: Response lengkap dari bot
     """
-    with st.spinner("🤖 Collega AI sedang menjawab..."):
-        try:
-            bot_reply = get_chat_response(messages)
-        except Exception as e:
-            bot_reply = f"⚠️ Terjadi kesalahan saat memanggil API Groq: {e}"
+    try:
+        bot_reply = st.write_stream(stream_chat_response(messages))
+    except Exception as e:
+        bot_reply = f"⚠️ Terjadi kesalahan saat memanggil API Groq: {e}"
+        st.markdown(bot_reply)
 
     return bot_reply
 
@@ -146,13 +141,11 @@ def handle_user_message(prompt: str):
     # Build messages dengan LangChain prompts dan RAG context jika ada
     messages, _ = build_messages_with_langchain(prompt)
 
-    # Dapatkan response dari bot
-    bot_reply = get_bot_response(messages)
+    # Stream balasan bot langsung ke UI
+    with st.chat_message("assistant"):
+        bot_reply = get_bot_response(messages)
 
-    # Tampilkan balasan bot
     st.session_state.chat_history.append({"role": "assistant", "content": bot_reply})
-    with st.chat_message("assistant"):
-        st.markdown(bot_reply)
 
     # Simpan session
     save_current_session()
\ No newline at end of file
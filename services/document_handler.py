@@ -1,5 +1,6 @@
+import hashlib
 import streamlit as st
-from services.rag_pipeline import load_pdf, split_documents, create_vectorstore
+from services.rag_pipeline import get_vectorstore
 
 
 def handle_document_upload():
@@ -12,10 +13,25 @@ def handle_document_upload():
     )
 
     if uploaded_file is not None:
+        digest = hashlib.blake2b(uploaded_file.getvalue(), digest_size=16).hexdigest()
+
+        # File yang sama sudah diproses pada rerun sebelumnya: cache hit murah. Jika handle-nya
+        # sudah dibuang dari cache proses, dimuat ulang dari disk (atau dibangun dari file ini)
+        if st.session_state.get("vectorstore_hash") == digest:
+            try:
+                get_vectorstore(digest, uploaded_file)
+            except RuntimeError:
+                st.session_state.pop("vectorstore_hash", None)
+            return
+
         with st.spinner("Memproses dokumen..."):
-            docs = load_pdf(uploaded_file)
-            split_docs = split_documents(docs)
-            vectorstore = create_vectorstore(split_docs)
-            st.session_state["vectorstore"] = vectorstore
+            # Dokumen yang sama di session lain memakai handle yang sama (st.cache_resource)
+            try:
+                get_vectorstore(digest, uploaded_file)
+            except RuntimeError:
+                # Pesan error sudah ditampilkan oleh create_vectorstore
+                return
+            # Hanya hash yang disimpan di session; handle-nya dimiliki cache proses yang dibatasi
+            st.session_state["vectorstore_hash"] = digest
 
         st.success("✅ Dokumen berhasil diproses dan siap digunakan untuk konteks RAG!")
\ No newline at end of file
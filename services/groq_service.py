@@ -1,8 +1,23 @@
 from config.settings import client
 
-def get_chat_response(messages, model="llama-3.3-70b-versatile"):
+def get_chat_response(messages, model="llama-3.3-70b-versatile", stream: bool = False):
+    if stream:
+        return (
+            chunk.choices[0].delta.content or ""
+            for chunk in client.chat.completions.create(
+                messages=messages,
+                model=model,
+                stream=True,
+            )
+        )
+
     response = client.chat.completions.create(
         messages=messages,
         model=model,
     )
     return response.choices[0].message.content
+
+
+def stream_chat_response(messages, model="llama-3.3-70b-versatile"):
+    """Yield the response text chunk by chunk as Groq generates it"""
+    return get_chat_response(messages, model=model, stream=True)
@@ -1,20 +1,111 @@
-import os, tempfile, streamlit as st
+import itertools, math, os, uuid, weakref, streamlit as st
+import faiss
+import fitz
+import numpy as np
+from functools import lru_cache
 from typing import List
-from langchain_community.document_loaders import PyPDFLoader
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 from langchain_community.vectorstores import FAISS
-from langchain_huggingface import HuggingFaceEmbeddings
+from langchain_community.vectorstores.utils import DistanceStrategy
+from langchain_community.docstore.in_memory import InMemoryDocstore
 from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from sentence_transformers import SentenceTransformer
+from config.settings import CACHE_DIR
+
+try:
+    import torch
+except ImportError:
+    torch = None
+
+try:
+    from sentence_transformers import CrossEncoder
+except ImportError:
+    CrossEncoder = None
+
+# Default: MiniLM multilingual (384 dim), cocok untuk dokumen berbahasa Indonesia.
+# Set EMBEDDING_MODEL=sentence-transformers/all-mpnet-base-v2 untuk model yang lebih besar.
+EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2")
+# Dokumen dengan chunk sebanyak ini atau lebih memakai IVF; di bawahnya flat (exact search)
+IVF_MIN_DOCS = 1000
+# Vektor disimpan int8 (SQ8) mulai jumlah ini; terlalu sedikit sampel membuat range kuantisasi buruk
+SQ_MIN_DOCS = 256
+IVF_NPROBE = 32
+# Versi layout index; naikkan jika cara membangun index berubah agar cache lama tidak dipakai
+_INDEX_LAYOUT = "ivf-sq8-ip-v2"
+# Index FAISS per dokumen disimpan per model, agar ganti model tidak memuat index lama
+_FAISS_CACHE_DIR = os.path.join(CACHE_DIR, "faiss", EMBEDDING_MODEL.replace("/", "__"), _INDEX_LAYOUT)
+
+# Reranker cross-encoder multilingual (mMARCO) untuk dokumen ID/EN; kosongkan untuk menonaktifkan
+RERANK_MODEL = os.getenv("RERANK_MODEL", "cross-encoder/mmarco-mMiniLMv2-L12-H384-v1")
+# Jumlah kandidat FAISS yang di-rerank sebelum diambil top_k
+RERANK_FETCH_K = 50
+
+# Registry vectorstore untuk cache retrieval; key unik per objek, tidak dipakai ulang
+_VECTORSTORES = weakref.WeakValueDictionary()
+_VECTORSTORE_KEYS = itertools.count()
+# Jumlah dokumen yang index-nya ditahan di memori proses, dan umur maksimumnya (detik)
+VECTORSTORE_CACHE_ENTRIES = 8
+VECTORSTORE_CACHE_TTL = 6 * 3600
+
+def _embedding_device() -> str:
+    return "cuda" if torch is not None and torch.cuda.is_available() else "cpu"
+
+class _SentenceEmbeddings(Embeddings):
+    """Embeddings LangChain yang memegang SentenceTransformer-nya sendiri"""
+
+    def __init__(self, model: SentenceTransformer, batch_size: int):
+        self.model = model
+        self.batch_size = batch_size
+
+    def encode(self, texts: List[str]) -> np.ndarray:
+        # Satu panggilan encode: batch dibagi oleh SentenceTransformer, hasil langsung matrix numpy.
+        # Newline diganti spasi di sini agar dokumen dan query selalu diproses sama
+        return self.model.encode(
+            [text.replace("\n", " ") for text in texts],
+            batch_size=self.batch_size,
+            normalize_embeddings=True,
+            convert_to_numpy=True,
+            show_progress_bar=False
+        )
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.encode(texts).tolist()
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+@st.cache_resource(show_spinner=False)
+def _get_embedder(model_name: str = EMBEDDING_MODEL) -> _SentenceEmbeddings:
+    # Satu instance model dipakai bersama oleh semua rerun dan session
+    device = _embedding_device()
+    # Jika GPU tidak terdeteksi padahal ada, cek driver dengan `nvidia-smi` dan versi torch CUDA
+    print(f"🧠 Embedding model {model_name} on {device}")
+    return _SentenceEmbeddings(
+        SentenceTransformer(model_name, device=device),
+        # Batch besar memenuhi GPU; di CPU batch kecil lebih hemat memori
+        batch_size=64 if device == "cuda" else 8
+    )
+
+@st.cache_resource(show_spinner=False)
+def _get_reranker(model_name: str = RERANK_MODEL):
+    if CrossEncoder is None or not model_name:
+        return None
+    try:
+        return CrossEncoder(model_name, device=_embedding_device())
+    except Exception as e:
+        # Gagal muat disimpan sebagai None: retrieval tetap memakai urutan FAISS
+        print(f"⚠️ Gagal memuat reranker {model_name}: {e}")
+        return None
 
 def load_pdf(uploaded_file) -> List[Document]:
     try:
-        with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf") as tmp:
-            tmp.write(uploaded_file.getvalue())
-            tmp_path = tmp.name
-        loader = PyPDFLoader(tmp_path)
-        docs = loader.load()
-        os.unlink(tmp_path)
-        return docs
+        # PyMuPDF (MuPDF, C) jauh lebih cepat dari pypdf; dibaca langsung dari memori tanpa file temp
+        with fitz.open(stream=uploaded_file.getvalue(), filetype="pdf") as pdf:
+            return [
+                Document(page_content=page.get_text(), metadata={"page": i, "source": uploaded_file.name})
+                for i, page in enumerate(pdf)
+            ]
     except Exception as e:
         st.error(f"Gagal memuat PDF: {e}")
         return []
@@ -23,21 +114,166 @@ def split_documents(docs: List[Document], chunk_size=1000, chunk_overlap=200):
     splitter = RecursiveCharacterTextSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
     return splitter.split_documents(docs)
 
+def _embed_texts(embeddings, texts: List[str]) -> np.ndarray:
+    # Tanpa konversi ke list of list seperti embed_documents
+    if isinstance(embeddings, _SentenceEmbeddings):
+        vectors = embeddings.encode(texts)
+    else:
+        vectors = embeddings.embed_documents(texts)
+    return np.asarray(vectors, dtype="float32")
+
+def _build_index(vectors: np.ndarray):
+    # Embedding sudah dinormalisasi, jadi inner product = cosine similarity
+    n, d = vectors.shape
+    if n < SQ_MIN_DOCS:
+        index = faiss.IndexFlatIP(d)
+    elif n < IVF_MIN_DOCS:
+        # 1 byte per dimensi, bukan 4: scan membaca 4x lebih sedikit memori
+        index = faiss.IndexScalarQuantizer(d, faiss.ScalarQuantizer.QT_8bit, faiss.METRIC_INNER_PRODUCT)
+        index.train(vectors)
+    else:
+        # nlist ~ 4*sqrt(N): scan hanya nprobe cluster per query, bukan seluruh N vektor
+        nlist = int(4 * math.sqrt(n))
+        quantizer = faiss.IndexFlatIP(d)
+        index = faiss.IndexIVFScalarQuantizer(
+            quantizer, d, nlist, faiss.ScalarQuantizer.QT_8bit, faiss.METRIC_INNER_PRODUCT
+        )
+        index.train(vectors)
+        index.nprobe = IVF_NPROBE
+    index.add(vectors)
+    return index
+
 def create_vectorstore(docs: List[Document]):
     try:
-        embeddings = HuggingFaceEmbeddings(model_name="sentence-transformers/all-mpnet-base-v2")
-        return FAISS.from_documents(docs, embeddings)
+        embeddings = _get_embedder(EMBEDDING_MODEL)
+        texts = [d.page_content for d in docs]
+        index = _build_index(_embed_texts(embeddings, texts))
+
+        ids = [str(uuid.uuid4()) for _ in docs]
+        docstore = InMemoryDocstore({
+            doc_id: Document(page_content=text, metadata=doc.metadata)
+            for doc_id, text, doc in zip(ids, texts, docs)
+        })
+        return FAISS(
+            embedding_function=embeddings,
+            index=index,
+            docstore=docstore,
+            index_to_docstore_id=dict(enumerate(ids)),
+            distance_strategy=DistanceStrategy.MAX_INNER_PRODUCT
+        )
     except Exception as e:
         st.error(f"Gagal membuat vectorstore: {e}")
         return None
 
+def _vectorstore_path(digest: str) -> str:
+    return os.path.join(_FAISS_CACHE_DIR, digest)
+
+def save_vectorstore(vectorstore, digest: str) -> None:
+    # Simpan index ke disk agar restart tidak perlu embed ulang dokumen yang sama
+    try:
+        vectorstore.save_local(_vectorstore_path(digest))
+    except Exception as e:
+        print(f"⚠️ Gagal menyimpan vectorstore: {e}")
+
+def load_vectorstore(digest: str):
+    path = _vectorstore_path(digest)
+    if not os.path.isdir(path):
+        return None
+    try:
+        embeddings = _get_embedder(EMBEDDING_MODEL)
+        # Index ditulis sendiri oleh aplikasi ini, jadi deserialisasi docstore aman
+        vectorstore = FAISS.load_local(
+            path, embeddings,
+            allow_dangerous_deserialization=True,
+            distance_strategy=DistanceStrategy.MAX_INNER_PRODUCT
+        )
+    except Exception as e:
+        print(f"⚠️ Gagal memuat vectorstore dari cache: {e}")
+        return None
+    # Samakan nprobe dengan setting saat ini, walau index disimpan dengan nilai lain
+    if isinstance(vectorstore.index, faiss.IndexIVF):
+        vectorstore.index.nprobe = IVF_NPROBE
+    return vectorstore
+
+@st.cache_resource(show_spinner=False, max_entries=VECTORSTORE_CACHE_ENTRIES, ttl=VECTORSTORE_CACHE_TTL)
+def get_vectorstore(doc_hash: str, _pdf_file=None):
+    """
+    Handle vectorstore satu dokumen, dimuat sekali per proses dan dipakai bersama semua session.
+
+    cache_resource (bukan cache_data) karena index FAISS adalah resource yang tidak boleh
+    di-copy/serialize setiap dipanggil. _pdf_file tidak ikut dalam key cache; hanya dipakai
+    untuk membangun index jika belum ada di disk. Exception tidak di-cache, jadi kegagalan
+    akan dicoba lagi pada pemanggilan berikutnya. Jumlah dokumen di memori dibatasi;
+    entry yang dibuang dimuat ulang dari salinan disk (save_vectorstore).
+    """
+    vectorstore = load_vectorstore(doc_hash)
+    if vectorstore is not None:
+        return vectorstore
+    if _pdf_file is None:
+        raise LookupError(f"Vectorstore untuk dokumen {doc_hash} belum dibuat")
+
+    vectorstore = create_vectorstore(split_documents(load_pdf(_pdf_file)))
+    if vectorstore is None:
+        raise RuntimeError("Gagal membuat vectorstore")
+    save_vectorstore(vectorstore, doc_hash)
+    return vectorstore
+
+def active_vectorstore():
+    """Vectorstore dokumen yang di-upload pada session ini, atau None."""
+    doc_hash = st.session_state.get("vectorstore_hash")
+    if not doc_hash:
+        return None
+    try:
+        return get_vectorstore(doc_hash)
+    except LookupError:
+        # Sudah dibuang dari cache proses dan salinan disk tidak ada: upload ulang dokumen
+        return None
+
+def _vectorstore_key(vectorstore) -> int:
+    key = getattr(vectorstore, "_retrieval_cache_key", None)
+    if key is None:
+        key = next(_VECTORSTORE_KEYS)
+        vectorstore._retrieval_cache_key = key
+        _VECTORSTORES[key] = vectorstore
+    return key
+
+@lru_cache(maxsize=256)
+def _embed_query(vs_key: int, query: str) -> tuple:
+    embedding_function = _VECTORSTORES[vs_key].embedding_function
+    embed = getattr(embedding_function, "embed_query", embedding_function)
+    return tuple(embed(query))
+
+def _normalize_query(query: str) -> str:
+    return " ".join(query.lower().split())
+
+@lru_cache(maxsize=128)
+def _retrieve_cached(vs_key: int, query: str, top_k: int) -> tuple:
+    # Hanya query yang sama persis (setelah normalisasi) yang memakai ulang hasil; query mirip
+    # seperti "laba Q3 2023" vs "laba Q4 2023" embedding-nya hampir identik tapi butuh chunk lain
+    return _search(vs_key, query, list(_embed_query(vs_key, query)), top_k)
+
+def _search(vs_key: int, query: str, embedding: list, top_k: int) -> tuple:
+    reranker = _get_reranker(RERANK_MODEL)
+    if reranker is None:
+        return tuple(_VECTORSTORES[vs_key].similarity_search_by_vector(embedding, k=top_k))
+
+    # Dua tahap: ambil kandidat lebar dari FAISS (murah), lalu cross-encoder memilih top_k
+    candidates = _VECTORSTORES[vs_key].similarity_search_by_vector(embedding, k=max(RERANK_FETCH_K, top_k))
+    if len(candidates) <= 1:
+        return tuple(candidates)
+    scores = reranker.predict([(query, d.page_content) for d in candidates], show_progress_bar=False)
+    ranked = sorted(zip(scores, range(len(candidates))), reverse=True)
+    return tuple(candidates[i] for _, i in ranked[:top_k])
+
 def retrieve_context(vectorstore, query: str, top_k=3):
     try:
-        retriever = vectorstore.as_retriever(search_kwargs={"k": top_k})
-        docs = retriever.invoke(query)
-        context = "\n\n".join([d.page_content for d in docs])
-        sources = [d.metadata.get("source", "Unknown") for d in docs]
-        return context, sources
+        # Key dinormalisasi: beda huruf besar/spasi tetap kena cache yang sama
+        docs = _retrieve_cached(_vectorstore_key(vectorstore), _normalize_query(query), top_k)
+        parts, sources = [], []
+        for d in docs:
+            parts.append(d.page_content)
+            sources.append(d.metadata.get("source", "Unknown"))
+        return "\n\n".join(parts), sources
     except Exception as e:
         st.error(f"Gagal retrieve context: {e}")
         return "", []
\ No newline at end of file
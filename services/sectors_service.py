@@ -2,16 +2,52 @@
 Service untuk integrasi dengan Sectors.app API
 Dokumentasi: https://docs.sectors.app/
 """
+import asyncio
+import json
+import logging
+import httpx
 import requests
-from typing import Dict, List, Optional, Any
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from typing import Dict, List, Optional, Any, Tuple
 from datetime import datetime
 import os
+from config.settings import CACHE_DIR
+from services.cache import FileCache
+from utils.json_compat import dumps_pretty, loads
+
+# Tracing request/response hanya aktif jika SECTORS_DEBUG di-set
+log = logging.getLogger("sectors")
+if os.getenv("SECTORS_DEBUG"):
+    log.setLevel(logging.DEBUG)
+    if not log.handlers:
+        log.addHandler(logging.StreamHandler())
+else:
+    log.setLevel(logging.WARNING)
 
 
 class SectorsAPI:
     """Client untuk Sectors Financial API"""
 
     BASE_URL = "https://api.sectors.app/v1"
+    # (connect, read) timeout dalam detik
+    TIMEOUT = (3, 10)
+    # TTL cache per prefix endpoint (detik), dicek berurutan: prefix spesifik di atas.
+    # Harga, data harian, ranking, dan snapshot index berubah selama jam bursa: TTL pendek.
+    # Hanya data yang jarang berubah (daftar perusahaan, segmen, laporan kuartalan) 24 jam.
+    CACHE_TTL = {
+        "companies/top/": 900,
+        "company/report/": 900,
+        "idx-total/": 900,
+        "index/": 900,
+        "subsector/report/": 900,
+        "news/": 3600,
+        "companies/": 86400,
+        "company/get-segments/": 86400,
+        "financials/quarterly/": 86400,
+    }
+    # Endpoint yang belum terdaftar dianggap data pasar
+    DEFAULT_CACHE_TTL = 900
 
     def __init__(self, api_key: Optional[str] = None):
         """
@@ -30,8 +66,53 @@ class SectorsAPI:
             "Authorization": self.api_key.strip()
         }
 
-        print(f"🔑 API Key configured (first 10 chars): {self.api_key[:10]}...")
-        print(f"📋 Headers: {self.headers}")
+        # Session dipakai ulang agar koneksi TLS ke API tetap hidup antar tool call
+        retry = Retry(
+            total=3,
+            backoff_factor=0.3,
+            status_forcelist=[429, 500, 502, 503, 504],
+            raise_on_status=False,
+            # Retry-After dari 429 bisa puluhan detik; backoff tetap pendek agar chat tidak macet
+            respect_retry_after_header=False
+        )
+        adapter = HTTPAdapter(max_retries=retry, pool_connections=10, pool_maxsize=20)
+        self.session = requests.Session()
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.session.headers.update(self.headers)
+
+        self.cache = FileCache(os.path.join(CACHE_DIR, "sectors"))
+
+        log.debug("🔑 API key configured")
+
+    @staticmethod
+    def _cache_key(endpoint: str, params: Optional[Dict]) -> str:
+        return f"{endpoint}?{json.dumps(params or {}, sort_keys=True, default=str)}"
+
+    def _cache_ttl(self, endpoint: str, params: Optional[Dict]) -> Optional[float]:
+        """TTL cache untuk endpoint; None berarti permanen"""
+        params = params or {}
+        # Rentang historis IDX yang sudah lewat tidak akan berubah lagi
+        if endpoint.startswith("idx-total/") and params.get("start") and params.get("end"):
+            if str(params["end"]) < datetime.now().strftime("%Y-%m-%d"):
+                return None
+
+        for prefix, ttl in self.CACHE_TTL.items():
+            if endpoint.startswith(prefix):
+                return ttl
+        return self.DEFAULT_CACHE_TTL
+
+    def _cache_get(self, endpoint: str, params: Optional[Dict]) -> Optional[Any]:
+        data = self.cache.get(self._cache_key(endpoint, params), self._cache_ttl(endpoint, params))
+        if data is not None:
+            log.debug("💾 Cache hit: %s", endpoint)
+        return data
+
+    def _cache_put(self, endpoint: str, params: Optional[Dict], data: Any) -> None:
+        # Response error tidak disimpan agar request berikutnya mencoba ulang
+        if isinstance(data, dict) and "error" in data:
+            return
+        self.cache.put(self._cache_key(endpoint, params), data)
 
     def _make_request(self, endpoint: str, params: Optional[Dict] = None) -> Dict:
         """
@@ -44,41 +125,119 @@ class SectorsAPI:
         Returns:
             Dict: Response JSON dari API
         """
+        cached = self._cache_get(endpoint, params)
+        if cached is not None:
+            return cached
+
         url = f"{self.BASE_URL}/{endpoint}"
 
         try:
-            print(f"🌐 API Request: {url}")
+            log.debug("🌐 API Request: %s", url)
             if params:
-                print(f"📋 Params: {params}")
+                log.debug("📋 Params: %s", params)
 
-            response = requests.get(url, headers=self.headers, params=params, timeout=10)
+            response = self.session.get(url, params=params, timeout=self.TIMEOUT)
 
-            print(f"📡 Status Code: {response.status_code}")
+            log.debug("📡 Status Code: %s", response.status_code)
 
             response.raise_for_status()
-            data = response.json()
+            # Parse bytes langsung (orjson jika ada), tanpa decode teks oleh requests/httpx
+            data = loads(response.content)
 
             if isinstance(data, dict):
-                print(f"✅ Response keys: {list(data.keys())}")
+                log.debug("✅ Response keys: %s", list(data.keys()))
             elif isinstance(data, list):
-                print(f"✅ Response: List with {len(data)} items")
+                log.debug("✅ Response: List with %d items", len(data))
 
+            self._cache_put(endpoint, params, data)
             return data
 
         except requests.exceptions.HTTPError as e:
-            if response.status_code == 429:
-                return {"error": "Rate limit exceeded. Tunggu beberapa saat."}
-            elif response.status_code == 400:
-                return {"error": f"Bad request: {response.text}"}
-            elif response.status_code == 404:
-                return {"error": f"Endpoint not found: {endpoint}"}
-            else:
-                return {"error": f"HTTP Error {response.status_code}: {response.text}"}
+            return self._http_error(response.status_code, response.text, endpoint)
         except requests.exceptions.Timeout:
             return {"error": "Request timeout. API tidak merespons."}
         except Exception as e:
             return {"error": f"Request failed: {str(e)}"}
 
+    @staticmethod
+    def _http_error(status_code: int, text: str, endpoint: str) -> Dict:
+        """Map HTTP error status ke dict error yang dipakai semua tool"""
+        if status_code == 429:
+            return {"error": "Rate limit exceeded. Tunggu beberapa saat."}
+        elif status_code == 400:
+            return {"error": f"Bad request: {text}"}
+        elif status_code == 404:
+            return {"error": f"Endpoint not found: {endpoint}"}
+        else:
+            return {"error": f"HTTP Error {status_code}: {text}"}
+
+    async def aget(self, client: httpx.AsyncClient, endpoint: str, params: Optional[Dict] = None) -> Dict:
+        """
+        Versi async dari _make_request
+
+        Args:
+            client: httpx.AsyncClient aktif (lihat fetch_many)
+            endpoint: API endpoint (tanpa base URL)
+            params: Query parameters (optional)
+
+        Returns:
+            Dict: Response JSON dari API
+        """
+        cached = self._cache_get(endpoint, params)
+        if cached is not None:
+            return cached
+
+        url = f"{self.BASE_URL}/{endpoint}"
+
+        try:
+            log.debug("🌐 Async API Request: %s", url)
+            if params:
+                log.debug("📋 Params: %s", params)
+
+            response = await client.get(url, params=params)
+
+            log.debug("📡 Status Code: %s", response.status_code)
+
+            response.raise_for_status()
+            # Parse bytes langsung (orjson jika ada), tanpa decode teks oleh requests/httpx
+            data = loads(response.content)
+
+            self._cache_put(endpoint, params, data)
+            return data
+
+        except httpx.HTTPStatusError as e:
+            return self._http_error(e.response.status_code, e.response.text, endpoint)
+        except httpx.TimeoutException:
+            return {"error": "Request timeout. API tidak merespons."}
+        except Exception as e:
+            return {"error": f"Request failed: {str(e)}"}
+
+    def fetch_many(self, calls: List[Tuple[str, Optional[Dict]]]) -> List[Any]:
+        """
+        Jalankan beberapa GET independen secara konkuren
+
+        Args:
+            calls: List of (endpoint, params)
+
+        Returns:
+            List: Response per call, urutan sama dengan input
+        """
+        if not calls:
+            return []
+
+        async def run():
+            # AsyncClient terikat ke event loop, jadi dibuat per batch di dalam asyncio.run
+            async with httpx.AsyncClient(
+                headers=self.headers,
+                timeout=httpx.Timeout(self.TIMEOUT[1], connect=self.TIMEOUT[0]),
+                limits=httpx.Limits(max_connections=50, max_keepalive_connections=20)
+            ) as client:
+                return await asyncio.gather(
+                    *(self.aget(client, endpoint, params) for endpoint, params in calls)
+                )
+
+        return list(asyncio.run(run()))
+
     # ==================== COMPANIES ====================
 
     def get_companies(
@@ -140,14 +299,14 @@ class SectorsAPI:
 
         return self._make_request(f"index/{index}/", params)
 
-    def get_companies_by_subsector(
-        self,
+    @staticmethod
+    def companies_by_subsector_request(
         subsector: str,
         sections: str = "all",
         n_stock: int = 50
-    ) -> List[Dict]:
+    ) -> Tuple[str, Dict]:
         """
-        Get companies by subsector
+        (endpoint, params) untuk get_companies_by_subsector, bisa dipakai langsung di fetch_many
         """
         params = {
             "sections": sections,
@@ -155,7 +314,18 @@ class SectorsAPI:
             "sub_sector": subsector
         }
 
-        return self._make_request("companies/", params)
+        return "companies/", params
+
+    def get_companies_by_subsector(
+        self,
+        subsector: str,
+        sections: str = "all",
+        n_stock: int = 50
+    ) -> List[Dict]:
+        """
+        Get companies by subsector
+        """
+        return self._make_request(*self.companies_by_subsector_request(subsector, sections, n_stock))
 
     # ==================== COMPANY DATA ====================
 
@@ -272,9 +442,8 @@ def format_company_overview(data: Dict) -> str:
         return f"❌ Error: {data['error']}"
 
     try:
-        print(f"\n🔍 Raw data keys: {list(data.keys())}")
-        import json
-        formatted_json = json.dumps(data, indent=2, ensure_ascii=False)
+        log.debug("🔍 Raw data keys: %s", list(data.keys()))
+        formatted_json = dumps_pretty(data)
 
         result = f"""
 DATA SAHAM (Raw API Response):
@@ -290,8 +459,8 @@ Silakan extract dan present informasi yang relevan sesuai pertanyaan user.
         return f"❌ Error formatting data: {str(e)}\n\nRaw response: {str(data)[:1000]}"
 
 
-def format_companies_list(data: List[Dict], title: str = "Companies") -> str:
-    """Return raw companies list untuk AI processing"""
+def format_companies_list(data: List[Dict], title: str = "Companies", total: Optional[int] = None) -> str:
+    """Return raw companies list untuk AI processing (data sudah di-slice oleh caller)"""
     if isinstance(data, dict) and "error" in data:
         return f"❌ Error: {data['error']}"
 
@@ -299,12 +468,11 @@ def format_companies_list(data: List[Dict], title: str = "Companies") -> str:
         if not data:
             return "Tidak ada data perusahaan ditemukan."
 
-        import json
-        limited_data = data[:20] if len(data) > 20 else data
-        formatted_json = json.dumps(limited_data, indent=2, ensure_ascii=False)
+        formatted_json = dumps_pretty(data)
+        total = len(data) if total is None else total
 
         result = f"""
-{title.upper()} (Total: {len(data)} companies, showing {len(limited_data)}):
+{title.upper()} (Total: {total} companies, showing {len(data)}):
 
 {formatted_json}
 
@@ -316,8 +484,8 @@ CATATAN: Silakan present data ini dalam format yang user-friendly.
         return f"❌ Error formatting data: {str(e)}"
 
 
-def format_news(data: List[Dict]) -> str:
-    """Return raw news list untuk AI processing"""
+def format_news(data: List[Dict], total: Optional[int] = None) -> str:
+    """Return raw news list untuk AI processing (data sudah di-slice oleh caller)"""
     if isinstance(data, dict) and "error" in data:
         return f"❌ Error: {data['error']}"
 
@@ -325,12 +493,11 @@ def format_news(data: List[Dict]) -> str:
         if not data:
             return "Tidak ada berita ditemukan."
 
-        import json
-        limited_data = data[:10] if len(data) > 10 else data
-        formatted_json = json.dumps(limited_data, indent=2, ensure_ascii=False)
+        formatted_json = dumps_pretty(data)
+        total = len(data) if total is None else total
 
         result = f"""
-BERITA TERKINI (Total: {len(data)} articles, showing {len(limited_data)}):
+BERITA TERKINI (Total: {total} articles, showing {len(data)}):
 
 {formatted_json}
 
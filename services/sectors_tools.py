@@ -10,23 +10,43 @@ from services.sectors_service import (
     format_companies_list,
     format_news
 )
+import logging
 import os
 import re
+import traceback
 from datetime import datetime
+from utils.json_compat import dumps_pretty
+
+# Logger dikonfigurasi di sectors_service (SECTORS_DEBUG)
+log = logging.getLogger("sectors")
+
+# Pola periode seperti "Q3 2024" / "2024-Q3", dikompilasi sekali saat import
+_Q_RE = re.compile(r'[Qq](\d)')
+_Y_RE = re.compile(r'20\d{2}')
+
+# Jumlah item maksimum yang diserialisasi ke prompt
+_MAX_LISTED_COMPANIES = 20
+_MAX_NEWS = 10
+
+
+def _format_companies(data, title: str) -> str:
+    # Slice sekali di sini; formatter hanya menserialisasi item yang ditampilkan
+    if isinstance(data, list):
+        return format_companies_list(data[:_MAX_LISTED_COMPANIES], title, total=len(data))
+    return format_companies_list(data, title)
 
 
 # Initialize Sectors API client
 sectors_client = None
 try:
     api_key = os.getenv("SECTORS_API_KEY")
-    print("Sectors API key: {}".format(api_key))
     if api_key:
         sectors_client = SectorsAPI(api_key=api_key)
-        print("✅ Sectors API client initialized successfully")
+        log.info("✅ Sectors API client initialized successfully")
     else:
-        print("⚠️ SECTORS_API_KEY not found in environment variables")
+        log.warning("⚠️ SECTORS_API_KEY not found in environment variables")
 except Exception as e:
-    print(f"❌ Error initializing Sectors API: {e}")
+    log.error("❌ Error initializing Sectors API: %s", e)
 
 
 @tool
@@ -75,7 +95,7 @@ def get_top_stocks_by_market_cap(limit: int = 5, sector: Optional[str] = None) -
             n_stock=limit
         )
 
-        return format_companies_list(
+        return _format_companies(
             data if isinstance(data, list) else data.get('data', []),
             "Top Companies by Market Cap"
         )
@@ -104,7 +124,7 @@ def get_companies_by_subsector(subsector: str, limit: int = 20) -> str:
             subsector.lower(),
             n_stock=limit
         )
-        return format_companies_list(data, f"Companies in {subsector.title()} subsector")
+        return _format_companies(data, f"Companies in {subsector.title()} subsector")
     except Exception as e:
         return f"❌ Error fetching companies: {str(e)}"
 
@@ -130,7 +150,7 @@ def get_companies_by_index(index: str, limit: int = 20) -> str:
             index.upper(),
             n_stock=limit
         )
-        return format_companies_list(data, f"Companies in {index.upper()} index")
+        return _format_companies(data, f"Companies in {index.upper()} index")
     except Exception as e:
         return f"❌ Error fetching index data: {str(e)}"
 
@@ -162,7 +182,7 @@ def search_companies(
             min_mcap_billion=min_mcap_billion,
             n_stock=limit
         )
-        return format_companies_list(data, "Search Results")
+        return _format_companies(data, "Search Results")
     except Exception as e:
         return f"❌ Error searching companies: {str(e)}"
 
@@ -258,7 +278,7 @@ def get_market_news(query: Optional[str] = None, limit: int = 10) -> str:
         data = sectors_client.get_news(query=query, order="desc")
 
         if isinstance(data, list):
-            data = data[:limit]
+            return format_news(data[:min(limit, _MAX_NEWS)], total=min(len(data), limit))
 
         return format_news(data)
     except Exception as e:
@@ -336,19 +356,20 @@ def get_quarterly_financials(ticker: str, quarter: Optional[int] = None, year: O
         # Get all quarterly data (last 8 quarters)
         data = sectors_client.get_quarterly_financials(ticker, n_quarters=8)
 
-        import json
-
-        # DEBUG: Print first item to see structure
-        if isinstance(data, list) and len(data) > 0:
-            print(f"📊 DEBUG - First item keys: {list(data[0].keys())}")
-            print(f"📊 DEBUG - First item sample: {json.dumps(data[0], indent=2)[:500]}")
-        elif isinstance(data, dict):
-            print(f"📊 DEBUG - Response is dict with keys: {list(data.keys())}")
-            print(f"📊 DEBUG - Dict sample: {json.dumps(data, indent=2)[:500]}")
+        # DEBUG: Print first item to see structure (sample hanya diserialisasi jika debug aktif)
+        if log.isEnabledFor(logging.DEBUG):
+            if isinstance(data, list) and len(data) > 0:
+                log.debug("📊 First item keys: %s", list(data[0].keys()))
+                log.debug("📊 First item sample: %s", dumps_pretty(data[0])[:500])
+            elif isinstance(data, dict):
+                log.debug("📊 Response is dict with keys: %s", list(data.keys()))
+                log.debug("📊 Dict sample: %s", dumps_pretty(data)[:500])
 
         # If specific quarter/year requested, filter the data
         if isinstance(data, list) and (quarter or year):
             filtered_data = []
+            # Dikumpulkan di pass yang sama untuk pesan "tidak ditemukan"
+            available_periods = []
             for item in data:
                 item_quarter = None
                 item_year = None
@@ -361,7 +382,7 @@ def get_quarterly_financials(ticker: str, quarter: Optional[int] = None, year: O
                         item_year = date_obj.year
                         item_quarter = (date_obj.month - 1) // 3 + 1 # Logika konversi bulan ke kuartal
                 except Exception as e:
-                    print(f"⚠️ Gagal parsing date: {e}")
+                    log.debug("⚠️ Gagal parsing date: %s", e)
                 
                 if not item_quarter:
                     item_quarter = item.get('quarter') or item.get('q') or item.get('period_quarter')
@@ -371,14 +392,17 @@ def get_quarterly_financials(ticker: str, quarter: Optional[int] = None, year: O
                 if not item_quarter and 'period' in item:
                     period_str = str(item.get('period', ''))
                     if 'Q' in period_str or 'q' in period_str:
-                        q_match = re.search(r'[Qq](\d)', period_str)
+                        q_match = _Q_RE.search(period_str)
                         if q_match:
                             item_quarter = int(q_match.group(1))
-                        y_match = re.search(r'20\d{2}', period_str)
+                        y_match = _Y_RE.search(period_str)
                         if y_match:
                             item_year = int(y_match.group(0))
 
-                print(f"🔍 Checking item - quarter: {item_quarter}, year: {item_year}")
+                log.debug("🔍 Checking item - quarter: %s, year: %s", item_quarter, item_year)
+
+                period = item.get('period', 'Unknown')
+                available_periods.append(f"{period} (Q{item_quarter} {item_year})" if item_quarter and item_year else period)
 
                 match = True
                 if quarter and item_quarter != quarter:
@@ -388,12 +412,15 @@ def get_quarterly_financials(ticker: str, quarter: Optional[int] = None, year: O
 
                 if match:
                     filtered_data.append(item)
+                    # Kuartal + tahun spesifik hanya punya satu entry
+                    if quarter and year:
+                        break
 
-            print(f"✅ Found {len(filtered_data)} matching items")
+            log.debug("✅ Found %d matching items", len(filtered_data))
 
             if filtered_data:
                 data = filtered_data
-                formatted_json = json.dumps(filtered_data, indent=2, ensure_ascii=False)
+                formatted_json = dumps_pretty(filtered_data)
                 result = f"""
 📊 QUARTERLY FINANCIAL DATA
 Company: {ticker}
@@ -405,13 +432,6 @@ INSTRUCTIONS: Extract and present quarterly financial metrics including revenue,
 """
             else:
                 # Show what data is available
-                available_periods = []
-                for item in data:
-                    item_quarter = item.get('quarter') or item.get('q') or item.get('period_quarter')
-                    item_year = item.get('year') or item.get('y') or item.get('period_year')
-                    period = item.get('period', 'Unknown')
-                    available_periods.append(f"{period} (Q{item_quarter} {item_year})" if item_quarter and item_year else period)
-
                 result = f"""
 ❌ Data tidak ditemukan untuk Q{quarter} {year}
 
@@ -419,11 +439,11 @@ Available periods in response:
 {chr(10).join(['  - ' + p for p in available_periods[:5]])}
 
 Raw first item:
-{json.dumps(data[0], indent=2, ensure_ascii=False)[:500] if data else 'No data'}
+{dumps_pretty(data[0])[:500] if data else 'No data'}
 """
         else:
             # Return all data
-            formatted_json = json.dumps(data, indent=2, ensure_ascii=False)
+            formatted_json = dumps_pretty(data)
             result = f"""
 📊 QUARTERLY FINANCIAL DATA
 Company: {ticker}
@@ -437,7 +457,6 @@ INSTRUCTIONS: Extract and present quarterly financial metrics.
         return result.strip()
 
     except Exception as e:
-        import traceback
         return f"❌ Error fetching quarterly data: {str(e)}\n\nTraceback:\n{traceback.format_exc()}"
 
 
@@ -0,0 +1,45 @@
+"""
+Test ekstraksi ticker dari nama perusahaan di dalam kalimat
+"""
+import os
+import tempfile
+
+import pytest
+
+pytest.importorskip("streamlit")
+pytest.importorskip("langchain_core")
+pytest.importorskip("groq")
+
+# config.settings membuat client Groq dan folder cache saat import
+os.environ.setdefault("GROQ_API_KEY", "test-key")
+os.environ.setdefault("COLLEGA_CACHE_DIR", tempfile.mkdtemp())
+
+from services import agent_service  # noqa: E402
+
+COMPANIES = [
+    {"company_name": "Kalbe Farma Tbk", "symbol": "KLBF.JK"},
+    {"company_name": "Charoen Pokphand Indonesia Tbk", "symbol": "CPIN.JK"},
+    {"company_name": "Bank Rakyat Indonesia (Persero) Tbk", "symbol": "BBRI.JK"},
+]
+
+
+@pytest.fixture(autouse=True)
+def company_cache():
+    previous = agent_service._COMPANY_CACHE
+    agent_service._set_company_cache(COMPANIES)
+    yield
+    agent_service._set_company_cache(previous or [])
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("Bagaimana kinerja kalbe farma?", "KLBF.JK"),
+    ("Info charoen pokphand dong", "CPIN.JK"),
+    ("Tolong cek laporan kalbe farma tahun ini", "KLBF.JK"),
+    ("harga saham Kalbe Farma", "KLBF.JK"),
+])
+def test_lowercase_company_name_mid_sentence(text, expected):
+    assert agent_service.extract_ticker(text) == expected
+
+
+def test_no_company_in_text():
+    assert agent_service.extract_ticker("Halo, apa kabar hari ini?") is None
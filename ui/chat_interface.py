@@ -1,14 +1,42 @@
 """
 UI Chat Interface untuk Streamlit dengan LangChain Agent Integration
 """
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
 import streamlit as st
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
 from langchain_core.messages import HumanMessage, AIMessage, SystemMessage
-from services.groq_service import get_chat_response
-from services.rag_pipeline import retrieve_context
-from services.agent_service import run_agent, is_financial_query, SECTORS_AVAILABLE
+from services.groq_service import get_chat_response, stream_chat_response
+from services.rag_pipeline import retrieve_context, active_vectorstore
+from services.agent_service import run_agent, is_financial_query, normalize_query, QueryPlan, SECTORS_AVAILABLE
 from utils.memory import save_current_session
 from typing import Optional
 
+# Logger dikonfigurasi di agent_service (COLLEGA_DEBUG)
+log = logging.getLogger("collega")
+
+# Role chat history -> class message LangChain (lookup sekali per pesan, bukan rantai if/elif)
+_MSG_CLASS = {"user": HumanMessage, "assistant": AIMessage, "system": SystemMessage}
+
+# Jumlah pesan terakhir yang dikirim apa adanya ke LLM; pesan yang lebih lama diringkas
+MAX_HISTORY_MSGS = 20
+SUMMARY_MODEL = "llama-3.1-8b-instant"
+# Ringkasan history dibuat di background, di luar jalur balasan
+# Batas backoff (dalam turn) setelah peringkasan gagal berturut-turut
+MAX_SUMMARY_BACKOFF_TURNS = 32
+_summary_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="history-summary")
+
+# Bagian statis system prompt mode standard; per turn hanya context/ringkasan yang disisipkan
+_SYS_HEAD = """You are Collega AI Assistant, a friendly and helpful chatbot.
+Use the following context from uploaded documents to help answer:
+
+Context:
+"""
+_SYS_TAIL = "\n\nAlways base your answer on the provided context when relevant."
+_SYS_NO_CTX = "You are Collega AI Assistant, a friendly and helpful chatbot created to assist users."
+_SYS_SUMMARY_HEAD = "\n\nSummary of the earlier conversation:\n"
+
 
 def display_chat_history():
     """Menampilkan riwayat chat dari session state"""
@@ -17,29 +45,59 @@ def display_chat_history():
             st.markdown(message["content"])
 
 
-def convert_chat_history_to_langchain():
+def convert_chat_history_to_langchain(messages: Optional[list] = None):
     """
     Konversi chat history dari format dict ke LangChain message objects
 
+    Args:
+        messages: Pesan yang dikonversi (default: seluruh chat history)
+
     Returns:
         list: List of LangChain message objects
     """
-    langchain_history = []
+    if messages is None:
+        messages = st.session_state.chat_history
 
-    for message in st.session_state.chat_history:
-        if message["role"] == "user":
-            langchain_history.append(HumanMessage(content=message["content"]))
-        elif message["role"] == "assistant":
-            langchain_history.append(AIMessage(content=message["content"]))
-        elif message["role"] == "system":
-            langchain_history.append(SystemMessage(content=message["content"]))
+    # Role yang tidak dikenal dilewati, sama seperti sebelumnya
+    return [
+        _MSG_CLASS[message["role"]](content=message["content"])
+        for message in messages
+        if message["role"] in _MSG_CLASS
+    ]
+
+
+def get_langchain_history() -> list:
+    """
+    LangChain history yang disimpan di session state dan diperbarui secara incremental
+
+    Returns:
+        list: List of LangChain message objects untuk seluruh chat history
+    """
+    chat_history = st.session_state.chat_history
+    synced = st.session_state.get("langchain_synced", 0)
+
+    # Bangun ulang jika session berganti atau history lebih pendek dari yang sudah dikonversi
+    if (
+        "langchain_history" not in st.session_state
+        or st.session_state.get("langchain_session") != st.session_state.get("current_session")
+        or synced > len(chat_history)
+    ):
+        st.session_state.langchain_history = []
+        st.session_state.langchain_session = st.session_state.get("current_session")
+        synced = 0
 
-    return langchain_history
+    # Hanya pesan baru yang dikonversi
+    if synced < len(chat_history):
+        st.session_state.langchain_history.extend(convert_chat_history_to_langchain(chat_history[synced:]))
+        st.session_state.langchain_synced = len(chat_history)
+
+    return st.session_state.langchain_history
 
 
 def get_rag_context(prompt: str) -> tuple[str, list]:
     """
     Ambil context dari RAG jika ada vectorstore
+    (tanpa elemen UI, agar bisa dijalankan di worker thread)
 
     Args:
         prompt: User query
@@ -50,34 +108,120 @@ def get_rag_context(prompt: str) -> tuple[str, list]:
     context_text = ""
     sources = []
 
-    if "vectorstore" in st.session_state and st.session_state["vectorstore"] is not None:
-        with st.spinner("📖 Mengambil konteks dari dokumen..."):
-            context_text, sources = retrieve_context(st.session_state["vectorstore"], prompt)
-            if context_text:
-                st.info(f"📚 Ditemukan konteks dari dokumen: {len(sources)} sumber")
+    vectorstore = active_vectorstore()
+    if vectorstore is not None:
+        context_text, sources = retrieve_context(vectorstore, prompt)
 
     return context_text, sources
 
 
-def get_bot_response_with_agent(prompt: str, rag_context: str = "") -> Optional[str]:
+def _script_executor(max_workers: int) -> ThreadPoolExecutor:
+    # Worker thread butuh ScriptRunContext agar bisa membaca st.session_state
+    ctx = get_script_run_ctx()
+    return ThreadPoolExecutor(
+        max_workers=max_workers,
+        initializer=lambda: add_script_run_ctx(threading.current_thread(), ctx)
+    )
+
+
+def _summarize_block(summary: str, block: str) -> str:
+    # Tanpa akses st.*: dijalankan di worker background
+    messages = [
+        {
+            "role": "system",
+            "content": "Ringkas percakapan berikut secara singkat dalam bahasa yang sama. "
+                       "Pertahankan fakta penting seperti nama perusahaan, ticker, angka, dan periode."
+        },
+        {
+            "role": "user",
+            "content": f"Ringkasan sebelumnya:\n{summary or '-'}\n\nPercakapan lanjutan:\n{block}"
+        }
+    ]
+    return get_chat_response(messages, model=SUMMARY_MODEL)
+
+
+def get_history_summary() -> str:
+    """
+    Ambil ringkasan history terbaru (menerapkan hasil job background yang sudah selesai)
+
+    Returns:
+        str: Ringkasan pesan di luar window MAX_HISTORY_MSGS (kosong jika belum ada)
+    """
+    job = st.session_state.get("history_summary_job")
+    if job is not None and job[1].done():
+        session_id, future, count = job
+        st.session_state.history_summary_job = None
+        if session_id == st.session_state.get("current_session"):
+            try:
+                st.session_state.history_summary = future.result()
+                st.session_state.history_summary_count = count
+                st.session_state.history_summary_failures = 0
+            except Exception as e:
+                # Backoff eksponensial per turn agar kegagalan tidak dicoba ulang setiap pesan
+                failures = st.session_state.get("history_summary_failures", 0) + 1
+                wait_turns = min(2 ** failures, MAX_SUMMARY_BACKOFF_TURNS)
+                st.session_state.history_summary_failures = failures
+                st.session_state.history_summary_retry_at = len(st.session_state.chat_history) + 2 * wait_turns
+                print(f"⚠️ Gagal meringkas history: {str(e)}")
+
+    return st.session_state.get("history_summary", "")
+
+
+def schedule_history_summary() -> None:
+    """
+    Jadwalkan peringkasan pesan yang sudah keluar dari window MAX_HISTORY_MSGS
+
+    Dipanggil setelah balasan selesai. Setiap pesan yang baru keluar dari window langsung
+    diringkas (satu panggilan model kecil per turn, di background); selama job berjalan
+    atau setelah gagal, LLM tetap hanya menerima MAX_HISTORY_MSGS pesan terakhir.
+    """
+    # Terapkan dulu hasil job yang sudah selesai; job yang masih berjalan tidak ditumpuk
+    summary = get_history_summary()
+    if st.session_state.get("history_summary_job") is not None:
+        return
+
+    history = st.session_state.chat_history
+    if len(history) < st.session_state.get("history_summary_retry_at", 0):
+        return
+
+    summarized = st.session_state.get("history_summary_count", 0)
+    cutoff = len(history) - MAX_HISTORY_MSGS
+    if cutoff <= summarized:
+        return
+
+    block = "\n".join(f"{msg['role']}: {msg['content']}" for msg in history[summarized:cutoff])
+    future = _summary_executor.submit(_summarize_block, summary, block)
+    st.session_state.history_summary_job = (st.session_state.current_session, future, cutoff)
+
+
+def get_bot_response_with_agent(
+    prompt: str,
+    rag_context: str = "",
+    plan: Optional[QueryPlan] = None
+) -> Optional[str]:
     """
     Dapatkan response menggunakan LangChain Agent
 
     Args:
         prompt: User input
         rag_context: Context from RAG (optional)
+        plan: QueryPlan hasil is_financial_query (optional)
 
     Returns:
         str: Bot response, or None if agent can't handle
     """
-    chat_history = convert_chat_history_to_langchain()
+    # Window tetap MAX_HISTORY_MSGS pesan; pesan yang lebih lama diwakili ringkasan
+    summary = get_history_summary()
+    chat_history = get_langchain_history()[-MAX_HISTORY_MSGS:]
 
     with st.spinner("🤖 Collega AI Agent sedang bekerja..."):
         try:
             response = run_agent(
                 user_input=prompt,
                 chat_history=chat_history,
-                rag_context=rag_context
+                rag_context=rag_context,
+                plan=plan,
+                history_summary=summary
             )
             return response  # Could be None if agent can't handle
         except Exception as e:
@@ -87,44 +231,43 @@ def get_bot_response_with_agent(prompt: str, rag_context: str = "") -> Optional[
 
 def get_bot_response_standard(prompt: str, rag_context: str = "") -> str:
     """
-    Dapatkan response menggunakan standard chat (tanpa agent)
+    Dapatkan response menggunakan standard chat (tanpa agent).
+    Response di-stream langsung ke chat bubble assistant.
 
     Args:
         prompt: User input
         rag_context: Context from RAG (optional)
 
     Returns:
-        str: Bot response
+        str: Bot response (teks lengkap setelah stream selesai)
     """
-    # Build system prompt
-    if rag_context:
-        system_content = f"""You are Collega AI Assistant, a friendly and helpful chatbot.
-Use the following context from uploaded documents to help answer:
+    # Build system prompt: tanpa context dan ringkasan, konstanta dipakai apa adanya
+    parts = [_SYS_HEAD, rag_context, _SYS_TAIL] if rag_context else [_SYS_NO_CTX]
 
-Context:
-{rag_context}
-
-Always base your answer on the provided context when relevant."""
-    else:
-        system_content = "You are Collega AI Assistant, a friendly and helpful chatbot created to assist users."
+    # Pesan di luar window hanya dikirim sebagai ringkasan
+    summary = get_history_summary()
+    if summary:
+        parts += (_SYS_SUMMARY_HEAD, summary)
+    system_content = "".join(parts) if len(parts) > 1 else parts[0]
 
     # Build messages
     messages = [{"role": "system", "content": system_content}]
 
-    # Add chat history
-    for msg in st.session_state.chat_history:
+    # Add chat history (hanya MAX_HISTORY_MSGS pesan terakhir)
+    for msg in st.session_state.chat_history[-MAX_HISTORY_MSGS:]:
         messages.append({"role": msg["role"], "content": msg["content"]})
 
     # Add current prompt
     messages.append({"role": "user", "content": prompt})
 
-    # Get response
-    with st.spinner("🤖 Collega AI sedang menjawab..."):
+    # Stream response: token pertama tampil tanpa menunggu seluruh jawaban
+    with st.chat_message("assistant"):
         try:
-            response = get_chat_response(messages)
-            return response
+            return st.write_stream(stream_chat_response(messages))
         except Exception as e:
-            return f"⚠️ Terjadi kesalahan: {str(e)}"
+            error_reply = f"⚠️ Terjadi kesalahan: {str(e)}"
+            st.markdown(error_reply)
+            return error_reply
 
 
 def handle_user_message(prompt: str):
@@ -139,23 +282,26 @@ def handle_user_message(prompt: str):
     with st.chat_message("user"):
         st.markdown(prompt)
 
-    # Get RAG context jika ada
-    rag_context, sources = get_rag_context(prompt)
-
     # Convert chat history to LangChain format for context
-    langchain_history = convert_chat_history_to_langchain()
+    langchain_history = get_langchain_history()
 
-    # Deteksi jenis query dengan CONTEXT
-    use_agent = is_financial_query(prompt, langchain_history) and SECTORS_AVAILABLE
+    # RAG retrieval dan deteksi jenis query (dengan CONTEXT) saling independen: jalankan paralel
+    with st.spinner("📖 Menganalisis pertanyaan..."):
+        with _script_executor(max_workers=2) as executor:
+            rag_future = executor.submit(get_rag_context, prompt)
+            route_future = executor.submit(is_financial_query, normalize_query(prompt), langchain_history)
+            rag_context, sources = rag_future.result()
+            is_financial, plan = route_future.result()
+
+    if rag_context:
+        st.info(f"📚 Ditemukan konteks dari dokumen: {len(sources)} sumber")
 
-    # ⬇️ TAMBAHKAN DEBUGGING INI
-    print(f"=" * 50)
-    print(f"USER INPUT: {prompt}")
-    print(f"SECTORS_AVAILABLE: {SECTORS_AVAILABLE}")
-    print(f"Chat history length: {len(langchain_history)}")
-    print(f"use_agent: {use_agent}")
-    print(f"=" * 50)
-    # ⬆️ SAMPAI SINI
+    use_agent = is_financial and SECTORS_AVAILABLE
+
+    log.debug(
+        "USER INPUT: %s | SECTORS_AVAILABLE: %s | Chat history length: %d | use_agent: %s",
+        prompt, SECTORS_AVAILABLE, len(langchain_history), use_agent
+    )
 
     # Initialize response
     bot_reply = None
@@ -167,7 +313,7 @@ def handle_user_message(prompt: str):
             st.write("📝 Checking conversation context...")
             st.write("🛠️ Memilih tools yang sesuai...")
 
-            bot_reply = get_bot_response_with_agent(prompt, rag_context)
+            bot_reply = get_bot_response_with_agent(prompt, rag_context, plan)
 
             if bot_reply:
                 status.update(label="✅ Processing complete", state="complete")
@@ -175,19 +321,23 @@ def handle_user_message(prompt: str):
                 st.write("⚠️ Agent tidak dapat menangani query ini")
                 status.update(label="⚠️ Falling back to standard mode", state="complete")
 
-    # Fallback to standard response if agent didn't handle it
+    # Fallback to standard response if agent didn't handle it (sudah tampil via stream)
     if bot_reply is None:
-        print("ℹ️ Using standard response (agent returned None or not applicable)")
+        log.debug("ℹ️ Using standard response (agent returned None or not applicable)")
         bot_reply = get_bot_response_standard(prompt, rag_context)
+    else:
+        # Tampilkan balasan agent
+        with st.chat_message("assistant"):
+            st.markdown(bot_reply)
 
-    # Tampilkan balasan bot
     st.session_state.chat_history.append({"role": "assistant", "content": bot_reply})
-    with st.chat_message("assistant"):
-        st.markdown(bot_reply)
 
     # Simpan session
     save_current_session()
 
+    # Ringkas pesan lama untuk turn berikutnya, tanpa menunda balasan ini
+    schedule_history_summary()
+
 def render_chat_interface():
     """
     Render complete chat interface
@@ -1,8 +1,7 @@
 import streamlit as st
 
-def setup_page():
-    st.set_page_config(page_title="Groq Chatbot", page_icon="🤖", layout="wide")
-    st.markdown("""
+# Dibangun sekali saat import, bukan setiap rerun
+_CSS_HTML = """
         <style>
             body {
                 background: linear-gradient(120deg, #d4fc79, #96e6a1);
@@ -24,4 +23,10 @@ def setup_page():
                 padding: 10px;
             }
         </style>
-    """, unsafe_allow_html=True)
+    """
+
+# Catatan: setup_page tidak dipanggil di mana pun; app/main_window.py memanggil st.set_page_config sendiri
+# dan tidak memasang CSS ini. Perubahan di modul ini tidak berpengaruh ke app yang berjalan.
+def setup_page():
+    st.set_page_config(page_title="Groq Chatbot", page_icon="🤖", layout="wide")
+    st.markdown(_CSS_HTML, unsafe_allow_html=True)
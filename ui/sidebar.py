@@ -1,17 +1,23 @@
 import streamlit as st
-from utils.memory import load_all_chat_sessions, create_new_session, init_chat_history
+from utils.memory import list_chat_sessions, sessions_dir_mtime, create_new_session, init_chat_history
+
+
+@st.cache_data(show_spinner=False)
+def _list_session_names(mtime: int) -> list:
+    # mtime hanya dipakai sebagai cache key: daftar dibaca ulang saat folder session berubah
+    return list_chat_sessions()
+
 
 def sidebar_section():
     st.sidebar.image("https://cdn-icons-png.flaticon.com/512/4712/4712039.png", width=100)
     st.sidebar.title("Collega AI Chatbot 🤖")
 
-    sessions = load_all_chat_sessions()
-    session_names = list(sessions.keys())[::-1]  # tampilkan yang terbaru di atas
+    session_names = _list_session_names(sessions_dir_mtime())
 
     # Tombol New Chat
     if st.sidebar.button("➕ New Chat", use_container_width=True):
-        new_session = create_new_session()
-        init_chat_history(new_session)
+        # create_new_session sudah men-set session aktif dan history kosong; tidak perlu load ulang
+        create_new_session()
         st.rerun()
 
     st.sidebar.markdown("---")
@@ -20,7 +26,8 @@ def sidebar_section():
     if not session_names:
         st.sidebar.info("Belum ada chat history.")
     else:
-        for name in session_names:
+        # Tampilkan yang terbaru di atas; reversed() tidak membuat salinan list
+        for name in reversed(session_names):
             is_selected = (
                 "current_session" in st.session_state
                 and st.session_state.current_session == name
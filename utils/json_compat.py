@@ -0,0 +1,37 @@
+"""
+Serialisasi JSON cepat: pakai orjson jika terpasang, fallback ke json standar
+"""
+import json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def dumps_pretty(data) -> str:
+    """JSON ter-indentasi 2 spasi, karakter non-ASCII tidak di-escape."""
+    if orjson is not None:
+        try:
+            return orjson.dumps(data, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS).decode("utf-8")
+        except TypeError:
+            # Mis. integer di atas 64-bit tidak didukung orjson; serahkan ke json standar
+            pass
+    return json.dumps(data, indent=2, ensure_ascii=False)
+
+
+def dumps(data) -> str:
+    """JSON ringkas satu baris (tanpa indentasi), karakter non-ASCII tidak di-escape."""
+    if orjson is not None:
+        try:
+            return orjson.dumps(data, option=orjson.OPT_NON_STR_KEYS).decode("utf-8")
+        except TypeError:
+            pass
+    return json.dumps(data, ensure_ascii=False)
+
+
+def loads(data):
+    """Parse JSON dari str atau bytes."""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
@@ -1,62 +1,195 @@
-import json
 import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+from urllib.parse import quote, unquote
 import streamlit as st
+from utils.json_compat import dumps, loads
 
+# Format lama: satu file JSON untuk semua session (hanya dibaca untuk migrasi)
 HISTORY_FILE = "chat_history.json"
+# Format baru: satu file JSONL per session, pesan baru cukup di-append
+SESSIONS_DIR = "chat_sessions"
+_SESSION_EXT = ".jsonl"
 
+# Isi tiap file session di memori; file dibaca ulang hanya jika mtime-nya berubah
+_SESSIONS_CACHE = {}
+_SESSION_MTIMES = {}
 
-def load_all_chat_sessions():
-    """Baca semua session chat dari file JSON."""
+# Save chat berjalan di satu worker background (urutan append terjaga);
+# lock mencegah file dibaca saat sedang ditulis
+_save_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="session-save")
+_FILE_LOCK = threading.Lock()
+
+
+def _session_path(session_id):
+    # Nama session memuat spasi dan ':', jadi di-quote agar aman sebagai nama file
+    return os.path.join(SESSIONS_DIR, quote(session_id, safe="") + _SESSION_EXT)
+
+
+def _file_mtime(path):
+    try:
+        return os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+
+def _read_session_file(path):
+    messages = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                messages.append(loads(line))
+            except ValueError:
+                # Baris terakhir bisa terpotong jika proses berhenti saat menulis
+                continue
+    return messages
+
+
+def _write_session_file(session_id, messages, mode="w"):
+    path = _session_path(session_id)
+    with _FILE_LOCK:
+        with open(path, mode, encoding="utf-8") as f:
+            for msg in messages:
+                f.write(dumps(msg) + "\n")
+        _SESSION_MTIMES[session_id] = _file_mtime(path)
+
+
+def _write_session_file_safe(session_id, messages, mode):
+    # Dijalankan di worker background: error cukup dicatat, UI tidak ikut gagal
+    try:
+        _write_session_file(session_id, messages, mode)
+    except Exception as e:
+        print(f"⚠️ Gagal menyimpan session {session_id}: {e}")
+
+
+def _migrate_legacy_history():
+    """Pindahkan chat_history.json lama ke format per-session sekali saja."""
+    if os.path.isdir(SESSIONS_DIR):
+        return
+    os.makedirs(SESSIONS_DIR, exist_ok=True)
     if not os.path.exists(HISTORY_FILE):
-        return {}
+        return
     try:
         with open(HISTORY_FILE, "r", encoding="utf-8") as f:
             content = f.read().strip()
-            if not content:
-                return {}
-            return json.loads(content)
-    except json.JSONDecodeError:
-        return {}
+        legacy = loads(content) if content else {}
+    except ValueError:
+        return
+    for session_id, messages in legacy.items():
+        _write_session_file(session_id, messages)
+
+
+def list_chat_sessions():
+    """Daftar nama session (dari nama file saja, isi tidak dibaca)."""
+    _migrate_legacy_history()
+    # Nama session berawalan timestamp, jadi urutan nama = urutan pembuatan
+    return [
+        unquote(filename[:-len(_SESSION_EXT)])
+        for filename in sorted(os.listdir(SESSIONS_DIR))
+        if filename.endswith(_SESSION_EXT)
+    ]
+
+
+def sessions_dir_mtime():
+    """mtime folder session; berubah setiap ada session dibuat atau dihapus."""
+    _migrate_legacy_history()
+    return _file_mtime(SESSIONS_DIR) or 0
+
+
+def load_chat_session(session_id):
+    """Baca pesan satu session; file yang tidak berubah tidak di-parse ulang."""
+    _migrate_legacy_history()
+    path = _session_path(session_id)
+    with _FILE_LOCK:
+        mtime = _file_mtime(path)
+        if mtime is None:
+            return []
+        # Save yang masih antre belum mengubah mtime, dan cache sudah berisi pesan barunya
+        if session_id not in _SESSIONS_CACHE or _SESSION_MTIMES.get(session_id) != mtime:
+            _SESSIONS_CACHE[session_id] = _read_session_file(path)
+            _SESSION_MTIMES[session_id] = mtime
+        return _SESSIONS_CACHE[session_id]
+
+
+def load_all_chat_sessions():
+    """Baca semua session chat dari folder session."""
+    return {session_id: load_chat_session(session_id) for session_id in list_chat_sessions()}
 
 
 def save_all_chat_sessions(sessions):
-    """Simpan semua session chat ke file JSON."""
-    with open(HISTORY_FILE, "w", encoding="utf-8") as f:
-        json.dump(sessions, f, ensure_ascii=False, indent=2)
+    """Simpan (tulis ulang) semua session chat."""
+    os.makedirs(SESSIONS_DIR, exist_ok=True)
+    for session_id, messages in sessions.items():
+        _write_session_file(session_id, messages)
+        _SESSIONS_CACHE[session_id] = messages
 
 
 def init_chat_history(session_id):
     """Inisialisasi chat history untuk session tertentu."""
-    sessions = load_all_chat_sessions()
+    if st.session_state.get("current_session") != session_id:
+        # Konteks ticker dan ringkasan history milik session lain tidak boleh terbawa
+        st.session_state.pop("last_ticker", None)
+        st.session_state.pop("last_ticker_idle", None)
+        st.session_state.pop("history_summary", None)
+        st.session_state.pop("history_summary_count", None)
+        st.session_state.pop("history_summary_job", None)
+        st.session_state.pop("history_summary_failures", None)
+        st.session_state.pop("history_summary_retry_at", None)
     st.session_state.current_session = session_id
-    st.session_state.chat_history = sessions.get(session_id, [])
+    # Salinan dangkal: append di session state tidak mengubah cache sebelum disimpan.
+    # File tidak di-parse ulang selama mtime-nya sama dengan isi cache.
+    st.session_state.chat_history = list(load_chat_session(session_id)) if session_id else []
+    # Jumlah pesan yang sudah ada di disk; save berikutnya hanya append sisanya
+    st.session_state.saved_msg_count = len(st.session_state.chat_history)
 
 
 def save_current_session():
-    """Simpan chat aktif tanpa menghapus session lain."""
+    """Simpan chat aktif di background: hanya pesan baru yang di-append ke file session."""
     if "current_session" not in st.session_state:
         return
 
-    # Load semua dulu agar tidak overwrite data lama
-    sessions = load_all_chat_sessions()
     current = st.session_state.current_session
-    sessions[current] = st.session_state.get("chat_history", [])
-    save_all_chat_sessions(sessions)
+    history = st.session_state.get("chat_history", [])
+    saved = st.session_state.get("saved_msg_count", 0)
+
+    os.makedirs(SESSIONS_DIR, exist_ok=True)
+    # Cache di-update dulu, agar load sebelum worker selesai sudah melihat pesan baru
+    _SESSIONS_CACHE[current] = list(history)
+    # Snapshot diambil di thread UI; worker hanya menulis list yang tidak berubah lagi
+    if saved > len(history):
+        # History dipendekkan: tulis ulang file session ini saja
+        _save_executor.submit(_write_session_file_safe, current, list(history), "w")
+    elif saved < len(history):
+        _save_executor.submit(_write_session_file_safe, current, history[saved:], "a")
+
+    st.session_state.saved_msg_count = len(history)
 
 
 def create_new_session():
     """Buat session baru dengan nama otomatis."""
-    sessions = load_all_chat_sessions()
     timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
     session_name = f"Session - {timestamp}"
 
-    # Tambahkan session baru ke dict lama, jangan reset
-    sessions[session_name] = []
-    save_all_chat_sessions(sessions)
+    # Cukup buat file kosong; session lain tidak disentuh
+    _migrate_legacy_history()
+    if not os.path.exists(_session_path(session_name)):
+        _write_session_file(session_name, [])
+    _SESSIONS_CACHE.setdefault(session_name, [])
 
     # Set ke session state
+    st.session_state.pop("last_ticker", None)
+    st.session_state.pop("last_ticker_idle", None)
+    st.session_state.pop("history_summary", None)
+    st.session_state.pop("history_summary_count", None)
+    st.session_state.pop("history_summary_job", None)
+    st.session_state.pop("history_summary_failures", None)
+    st.session_state.pop("history_summary_retry_at", None)
     st.session_state.current_session = session_name
     st.session_state.chat_history = []
+    st.session_state.saved_msg_count = 0
 
     return session_name